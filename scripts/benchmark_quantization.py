@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark quantized first-pass vector search against exact float search.
+
+Builds one NumpyFlatStore per quantization ("none", "int8", "binary") from the
+same embeddings and reports, for each, the bytes scanned per vector in the
+first pass, the size on disk, recall@k against exact search and query latency.
+
+By default the embeddings are synthetic: clustered, anisotropic unit vectors
+shaped like MiniLM's. Pass --pdf to embed a real book with the app's model.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from core.vector_backends import NumpyFlatStore, QUANTIZATIONS
+
+
+def synthetic_embeddings(chunks, queries, dim, seed):
+    """Unit vectors around a shared offset and topic clusters, with queries near stored chunks"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, chunks // 100), dim))
+    vectors = centers[rng.integers(0, len(centers), chunks)] + 0.6 * rng.normal(size=(chunks, dim))
+    vectors += 1.5 * rng.normal(size=dim)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    query_vectors = vectors[rng.integers(0, chunks, queries)] + 0.5 / np.sqrt(dim) * rng.normal(size=(queries, dim))
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32), query_vectors.astype(np.float32)
+
+
+def book_embeddings(pdf_path, queries, seed):
+    """Embed a book's chunks, and the opening words of random chunks as queries"""
+    from core.ingestion import IngestionEngine, IngestionStats
+    from core.rag_chain import get_embeddings
+    from utils.pdf_utils import iter_text_from_pdf
+
+    embeddings = get_embeddings()
+    engine = IngestionEngine(embeddings)
+    texts = [
+        text
+        for batch in engine.iter_batches(iter_text_from_pdf(pdf_path), IngestionStats())
+        for text, _ in batch
+    ]
+    print(f"Embedding {len(texts):,} chunks from {pdf_path}...")
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+    sampled = random.Random(seed).choices(texts, k=queries)
+    query_vectors = np.asarray([embeddings.embed_query(" ".join(text.split()[:12])) for text in sampled], dtype=np.float32)
+    return vectors, query_vectors
+
+
+def store_size(store):
+    """(bytes scanned per vector in the first pass, total bytes on disk)"""
+    files = {name: os.path.getsize(os.path.join(store.path, name)) for name in os.listdir(store.path)}
+    rows = store.count_chunks()
+    if store.quantization == "int8":
+        first_pass = files["codes.npy"] + files["scales.npy"] + files["norms.npy"]
+    elif store.quantization == "binary":
+        first_pass = files["codes.npy"]
+    else:
+        first_pass = files["vectors.npy"] + files["norms.npy"]
+    return first_pass / rows, sum(files.values())
+
+
+def run(vectors, query_vectors, k, rescore_factor, dtype):
+    ids = [f"chunk_{i}" for i in range(len(vectors))]
+    exact = [set(np.argsort(((vectors - query) ** 2).sum(axis=1))[:k]) for query in query_vectors]
+
+    print(f"\n{len(vectors):,} vectors x {vectors.shape[1]} dims, {len(query_vectors)} queries, "
+          f"k={k}, rescore factor {rescore_factor}, {dtype} rows\n")
+    print(f"{'quantization':<14}{'bytes/vector':>14}{'reduction':>11}{'disk MB':>10}{'recall@k':>10}{'ms/query':>10}")
+
+    baseline = None
+    with tempfile.TemporaryDirectory() as persist_directory:
+        for quantization in QUANTIZATIONS:
+            store = NumpyFlatStore(
+                persist_directory, f"bench_{quantization}", dtype=dtype,
+                quantization=quantization, rescore_factor=rescore_factor
+            )
+            store.upsert_chunks(ids, vectors, [""] * len(ids), [{}] * len(ids))
+            store.flush()
+            store.count_chunks()
+
+            start = time.perf_counter()
+            results = [store.similarity_search_by_vector_with_relevance_scores(query, k=k) for query in query_vectors]
+            ms_per_query = (time.perf_counter() - start) * 1000 / len(query_vectors)
+
+            recall = np.mean([
+                len(truth & {int(doc.id.split("_")[1]) for doc, _ in hits}) / k
+                for truth, hits in zip(exact, results)
+            ])
+            per_vector, disk = store_size(store)
+            baseline = baseline or per_vector
+            print(f"{quantization:<14}{per_vector:>14.1f}{baseline / per_vector:>10.1f}x"
+                  f"{disk / 1e6:>10.1f}{recall:>10.3f}{ms_per_query:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="embed this PDF instead of using synthetic vectors")
+    parser.add_argument("--chunks", type=int, default=50000, help="synthetic vectors to index")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector dimensions")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=10)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.pdf:
+        vectors, query_vectors = book_embeddings(args.pdf, args.queries, args.seed)
+    else:
+        vectors, query_vectors = synthetic_embeddings(args.chunks, args.queries, args.dim, args.seed)
+    run(vectors, query_vectors, args.k, args.rescore_factor, args.dtype)
+
+
+if __name__ == "__main__":
+    main()
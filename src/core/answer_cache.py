@@ -0,0 +1,142 @@
+import logging
+import re
+import time
+
+import numpy as np
+
+from core.config import ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY
+from core.connection_pool import transaction
+from core.database import BookDatabase
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variants share a key"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+class AnswerCache:
+    """
+    Answers cached in books.db keyed by (collection, normalized question, model, prompt version).
+    With a similarity threshold, a question whose embedding is close enough to a
+    cached one also hits. Entries expire after ttl_seconds and the least recently
+    hit entries are evicted past max_entries.
+    """
+    
+    def __init__(self, db_path="books.db", ttl_seconds=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, similarity_threshold=ANSWER_CACHE_SIMILARITY):
+        # Makes sure the answer_cache table has been migrated in
+        BookDatabase(db_path)
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+    
+    def lookup(self, collection_name, question, model_name, prompt_version, embed_query=None):
+        """
+        Return (answer, sources) for a cached answer, or None on a miss.
+        embed_query: optional callable text -> vector used for near-duplicate matching
+        """
+        question_norm = normalize_question(question)
+        oldest = time.time() - self.ttl_seconds
+        key = (collection_name, model_name, str(prompt_version))
+        
+        with transaction(self.db_path) as cursor:
+            cursor.execute('''
+                SELECT id, answer, sources
+                FROM answer_cache
+                WHERE collection_name = ? AND model_name = ? AND prompt_version = ?
+                  AND question_norm = ? AND created_at >= ?
+            ''', key + (question_norm, oldest))
+            row = cursor.fetchone()
+        
+        if row is None and self.similarity_threshold > 0 and embed_query is not None:
+            row = self._lookup_similar(key, embed_query(question_norm), oldest)
+        
+        if row is None:
+            return None
+        
+        entry_id, answer, sources = row
+        with transaction(self.db_path) as cursor:
+            cursor.execute('''
+                UPDATE answer_cache
+                SET hits = hits + 1, last_hit = ?
+                WHERE id = ?
+            ''', (time.time(), entry_id))
+        return answer, sources
+    
+    def _lookup_similar(self, key, query_vector, oldest):
+        """Return the most similar cached entry above the threshold, or None"""
+        with transaction(self.db_path) as cursor:
+            cursor.execute('''
+                SELECT id, answer, sources, question_embedding
+                FROM answer_cache
+                WHERE collection_name = ? AND model_name = ? AND prompt_version = ?
+                  AND question_embedding IS NOT NULL AND created_at >= ?
+            ''', key + (oldest,))
+            rows = cursor.fetchall()
+        if not rows:
+            return None
+        
+        query = np.array(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        matrix = np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        logger.info(f"Answer cache semantic hit (similarity {similarities[best]:.3f})")
+        return rows[best][:3]
+    
+    def store(self, collection_name, question, model_name, prompt_version, answer, sources=None,
+              embed_query=None):
+        """Cache an answer, replacing any previous answer for the same key"""
+        question_norm = normalize_question(question)
+        embedding = None
+        if self.similarity_threshold > 0 and embed_query is not None:
+            embedding = np.asarray(embed_query(question_norm), dtype=np.float32).tobytes()
+        now = time.time()
+        
+        with transaction(self.db_path) as cursor:
+            cursor.execute('''
+                INSERT OR REPLACE INTO answer_cache (
+                    collection_name, question_norm, model_name, prompt_version,
+                    answer, sources, question_embedding, created_at, last_hit
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (collection_name, question_norm, model_name, str(prompt_version),
+                  answer, sources, embedding, now, now))
+            self._evict(cursor, now)
+    
+    def _evict(self, cursor, now):
+        """Drop expired entries, then the least recently hit ones beyond max_entries"""
+        cursor.execute('DELETE FROM answer_cache WHERE created_at < ?', (now - self.ttl_seconds,))
+        cursor.execute('SELECT COUNT(*) FROM answer_cache')
+        excess = cursor.fetchone()[0] - self.max_entries
+        if excess > 0:
+            cursor.execute('''
+                DELETE FROM answer_cache WHERE id IN (
+                    SELECT id FROM answer_cache ORDER BY last_hit LIMIT ?
+                )
+            ''', (excess,))
+    
+    def invalidate_collection(self, collection_name):
+        """Drop every cached answer for a collection"""
+        with transaction(self.db_path) as cursor:
+            cursor.execute('DELETE FROM answer_cache WHERE collection_name = ?', (collection_name,))
+
+
+_default_cache = None
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache, or None when it is disabled"""
+    global _default_cache
+    if ANSWER_CACHE_MAX_ENTRIES <= 0:
+        return None
+    if _default_cache is None:
+        _default_cache = AnswerCache()
+    return _default_cache
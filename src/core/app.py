@@ -4,8 +4,13 @@ import warnings
 import json
 import logging
 from ui.main_ui import main_ui
-from core.rag_chain import get_ollama_llm, get_qa_chain, get_summary_chain, chunk_and_embed, load_existing_vector_store
+from core.rag_chain import (
+    get_ollama_llm, stream_qa_answer, get_summary_chain, get_vector_store, get_chunk_count, get_embeddings,
+    LLM_MODEL_NAME, QA_PROMPT_VERSION
+)
+from core.answer_cache import get_answer_cache
 from core.database import BookDatabase
+from core.jobs import get_job_queue
 
 # Setup logging
 logging.basicConfig(
@@ -26,6 +31,20 @@ warnings.filterwarnings("ignore", category=UserWarning)
 os.environ["LANGCHAIN_TRACING_V2"] = "false"
 os.environ["LANGCHAIN_TELEMETRY"] = "false"
 
+def store_chat_answer(db, book_id, question, answer, sources):
+    """Persist an answer to the chat history and refresh the UI"""
+    db.add_chat_history(
+        book_id=book_id,
+        question=question,
+        answer=answer,
+        sources=sources
+    )
+    db.update_last_accessed(book_id)
+    del st.session_state.pending_question
+    st.session_state["chat_loading"] = False
+    logger.info("Chat answer stored and UI updated.")
+    st.rerun()
+
 def handle_chat_interaction():
     """Handle chat interactions when a question is asked"""
     if hasattr(st.session_state, 'pending_question') and st.session_state.pending_question:
@@ -37,40 +56,52 @@ def handle_chat_interaction():
                 db = BookDatabase()
                 book_info = db.get_book_by_id(book_id)
                 if book_info:
-                    llm = get_ollama_llm()
                     collection_name = book_info[4]
+                    
+                    # Repeated questions are answered without retrieval or generation
+                    answer_cache = get_answer_cache()
+                    embed_query = get_embeddings().embed_query
+                    cached = None
+                    if answer_cache:
+                        cached = answer_cache.lookup(
+                            collection_name, question, LLM_MODEL_NAME, QA_PROMPT_VERSION, embed_query=embed_query
+                        )
+                    if cached:
+                        logger.info("Answer served from cache.")
+                        answer, sources_json = cached
+                        sources = json.loads(sources_json) if sources_json else None
+                        store_chat_answer(db, book_id, question, answer, sources)
+                        return
+                    
+                    llm = get_ollama_llm()
                     logger.info(f"Loading vector store for collection: {collection_name}")
-                    vector_store = load_existing_vector_store(persist_directory="./chroma_db", collection_name=collection_name)
+                    vector_store = get_vector_store(persist_directory="./chroma_db", collection_name=collection_name)
                     if not vector_store:
                         logger.error("Could not load vector store.")
                         st.error("❌ Could not load book data. Please re-upload and process the book.")
                         st.session_state["chat_loading"] = False
                         return
-                    test_docs = vector_store.similarity_search("test", k=1)
-                    if not test_docs:
+                    if get_chunk_count(vector_store) == 0:
                         logger.error("Vector store is empty.")
                         st.error("❌ This book has no processed content. Please re-upload and process the book.")
                         st.session_state["chat_loading"] = False
                         return
-                    qa_chain = get_qa_chain(vector_store, llm)
-                    logger.info("Invoking QA chain...")
-                    response = qa_chain.invoke({"query": question})
-                    sources = []
-                    if hasattr(response, 'source_documents'):
-                        for doc in response.source_documents:
-                            if hasattr(doc, 'metadata'):
-                                sources.append(doc.metadata)
-                    db.add_chat_history(
-                        book_id=book_id,
-                        question=question,
-                        answer=response['result'] if 'result' in response else str(response),
-                        sources=json.dumps(sources) if sources else None
-                    )
-                    db.update_last_accessed(book_id)
-                    del st.session_state.pending_question
-                    st.session_state["chat_loading"] = False
-                    logger.info("Chat answer stored and UI updated.")
-                    st.rerun()
+                    logger.info("Streaming QA answer...")
+                    source_documents, tokens = stream_qa_answer(vector_store, llm, question)
+                    sources = [doc.metadata for doc in source_documents if hasattr(doc, 'metadata')]
+                    
+                    # Render tokens into the chat tab as they arrive
+                    placeholder = st.session_state.pop("chat_answer_placeholder", None)
+                    with placeholder.container() if placeholder else st.chat_message("assistant"):
+                        answer = st.write_stream(tokens)
+                    if not isinstance(answer, str):
+                        answer = "".join(str(part) for part in answer)
+                    if answer_cache:
+                        answer_cache.store(
+                            collection_name, question, LLM_MODEL_NAME, QA_PROMPT_VERSION,
+                            answer, json.dumps(sources) if sources else None, embed_query=embed_query
+                        )
+                    store_chat_answer(db, book_id, question, answer, sources)
                 else:
                     logger.error("Book not found in database.")
                     st.error("❌ Book not found!")
@@ -95,19 +126,19 @@ def handle_summary_generation():
                     llm = get_ollama_llm()
                     collection_name = book_info[4]
                     logger.info(f"Loading vector store for summary: {collection_name}")
-                    vector_store = load_existing_vector_store(persist_directory="./chroma_db", collection_name=collection_name)
+                    vector_store = get_vector_store(persist_directory="./chroma_db", collection_name=collection_name)
                     if not vector_store:
                         logger.error("Could not load vector store for summary.")
                         st.error("❌ Could not load book data. Please re-upload and process the book.")
                         return
-                    test_docs = vector_store.similarity_search("test", k=1)
-                    if not test_docs:
+                    if get_chunk_count(vector_store) == 0:
                         logger.error("Vector store is empty for summary.")
                         st.error("❌ This book has no processed content. Please re-upload and process the book.")
                         return
                     summary_chain = get_summary_chain(vector_store, llm)
                     logger.info("Invoking summary chain...")
-                    summary = summary_chain()
+                    summary_result = summary_chain()
+                    summary = summary_result['result'] if isinstance(summary_result, dict) else summary_result
                     if summary:
                         db.add_summary(book_id, summary)
                         st.success("✅ Summary generated successfully!")
@@ -128,8 +159,12 @@ def handle_summary_generation():
 def main():
     logger.info("Starting Book RAG Assistant app...")
     db = BookDatabase()
+    # Start the workers with the app so jobs interrupted by a restart resume without waiting for an upload
+    get_job_queue()
     main_ui()
     handle_chat_interaction()
+    # The placeholder belongs to this run's chat tab only
+    st.session_state.pop("chat_answer_placeholder", None)
     handle_summary_generation()
 
 if __name__ == "__main__":
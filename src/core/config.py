@@ -29,4 +29,85 @@ def configure_app():
     # Suppress specific logger warnings
     logging.getLogger("chromadb").setLevel(logging.WARNING)
     logging.getLogger("langchain").setLevel(logging.WARNING)
-    logging.getLogger("torch").setLevel(logging.WARNING) 
\ No newline at end of file
+    logging.getLogger("torch").setLevel(logging.WARNING) 
+
+# Maximum number of open vector store handles kept in memory
+VECTOR_STORE_POOL_SIZE = int(os.environ.get("VECTOR_STORE_POOL_SIZE", "8"))
+
+# Vector backend new books are stored with: "chroma", or "numpy" for a flat
+# memory-mapped index; existing books keep the backend they were written with.
+# VECTOR_INDEX_DTYPE is "float32" or "float16" (half the disk and RAM) for numpy
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_DTYPE = os.environ.get("VECTOR_INDEX_DTYPE", "float32")
+
+# First-pass search codes for new numpy-backend books: "none", "int8" (4x smaller
+# than float32) or "binary" (32x smaller). The closest k * QUANTIZED_RESCORE_FACTOR
+# candidates are re-scored exactly against the float vectors
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")
+QUANTIZED_RESCORE_FACTOR = int(os.environ.get("QUANTIZED_RESCORE_FACTOR", "10"))
+
+# Embedding ingestion: chunks written per batch, sentence-transformers encode
+# batch size and CPU threads used by torch (0 keeps the torch default)
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "256"))
+EMBED_ENCODE_BATCH_SIZE = int(os.environ.get("EMBED_ENCODE_BATCH_SIZE", "32"))
+EMBED_NUM_THREADS = int(os.environ.get("EMBED_NUM_THREADS", "0"))
+
+# Worker processes each ingest job uses to extract PDF text (0 or 1 extracts
+# in-process). Every ingest worker runs its own pool, so keep this small enough
+# that INGEST_WORKERS pools leave CPU for the embedding encoder
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", "2"))
+
+# Persistent chunk embedding cache (set EMBEDDING_CACHE_MAX_ENTRIES=0 to disable)
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+# In-memory cache of question embeddings (set to 0 to disable)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+# Background ingestion workers and how often idle workers poll the jobs table (seconds)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2.0"))
+
+# SQLite connection tuning: page cache per connection (KB) and how long to wait on a locked database (seconds)
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", "30"))
+
+# Answer cache: entry lifetime (seconds), size bound and the cosine similarity at
+# which a differently phrased question reuses an answer. Semantic matching is off
+# by default (0): questions differing only in a name or number embed very closely
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0"))
+
+# Ollama servers to balance generations over (comma separated, OLLAMA_BASE_URL is
+# used when unset or empty), the model to run, how often endpoints are health checked and how
+# long a failed endpoint stays out of rotation (seconds)
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_ENDPOINTS = [
+    url.strip() for url in os.environ.get("OLLAMA_ENDPOINTS", OLLAMA_BASE_URL).split(",") if url.strip()
+] or [OLLAMA_BASE_URL]
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama2")
+LLM_HEALTH_CHECK_INTERVAL = float(os.environ.get("LLM_HEALTH_CHECK_INTERVAL", "30"))
+LLM_FAILOVER_COOLDOWN = float(os.environ.get("LLM_FAILOVER_COOLDOWN", "30"))
+
+# Ollama client per endpoint: concurrent generations, request/connect timeouts (seconds)
+# and the size of the keep-alive connection pool
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "2"))
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", "300"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "10"))
+
+# Map-reduce summaries: characters of book text per leaf summary, summaries merged
+# per reduce step and LLM calls run at once
+SUMMARY_GROUP_CHARS = int(os.environ.get("SUMMARY_GROUP_CHARS", "6000"))
+SUMMARY_REDUCE_FANOUT = int(os.environ.get("SUMMARY_REDUCE_FANOUT", "6"))
+SUMMARY_MAX_CONCURRENCY = int(os.environ.get("SUMMARY_MAX_CONCURRENCY", "4"))
+
+# Hybrid retrieval: candidates fetched from each of the vector and keyword indexes,
+# and the reciprocal rank fusion constant (higher flattens the rank weighting)
+HYBRID_FETCH_K = int(os.environ.get("HYBRID_FETCH_K", "20"))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+# Library-wide search: passages returned and collections queried at once
+LIBRARY_SEARCH_K = int(os.environ.get("LIBRARY_SEARCH_K", "10"))
+LIBRARY_SEARCH_WORKERS = int(os.environ.get("LIBRARY_SEARCH_WORKERS", "8"))
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from core.config import SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT
+
+# Prepared statements kept per connection; every query in the app fits easily
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def _open_connection(db_path):
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE)
+    # WAL lets readers run alongside a writer instead of failing with "database is locked"
+    conn.execute('PRAGMA journal_mode=WAL')
+    # NORMAL is durable across application crashes in WAL mode and skips most fsyncs
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    # Off by default in SQLite; needed for ON DELETE CASCADE
+    conn.execute('PRAGMA foreign_keys=ON')
+    return conn
+
+
+def get_connection(db_path):
+    """Return this thread's long-lived connection to db_path, opening it on first use"""
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    key = os.path.abspath(db_path)
+    conn = connections.get(key)
+    if conn is None:
+        conn = _open_connection(db_path)
+        connections[key] = conn
+    return conn
+
+
+@contextmanager
+def transaction(db_path):
+    """Yield a cursor on the pooled connection, committing on success and rolling back on error"""
+    conn = get_connection(db_path)
+    cursor = conn.cursor()
+    try:
+        yield cursor
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def close_thread_connections():
+    """Close every pooled connection owned by the calling thread"""
+    connections = getattr(_local, "connections", None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
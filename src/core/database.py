@@ -3,219 +3,722 @@ import os
 import json
 from datetime import datetime
 from pathlib import Path
+from core.connection_pool import transaction
+from core.vector_store_pool import vector_store_pool
+from core.lexical_index import LexicalIndex
+from core.vector_backends import numpy_store_path
 
-class BookDatabase:
-    def __init__(self, db_path="books.db"):
-        self.db_path = db_path
-        self.init_database()
+def _ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table if it is missing"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _migration_initial_schema(cursor):
+    """Create the original tables; safe to run on databases that predate versioning"""
+    # Books table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            collection_name TEXT NOT NULL,
+            pages INTEGER,
+            total_chars INTEGER,
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            content_hash TEXT
+        )
+    ''')
     
-    def init_database(self):
-        """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Books table
+    # Databases created before content hashing lack the column
+    _ensure_column(cursor, 'books', 'content_hash', 'TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_content_hash ON books (content_hash)')
+    
+    # Chat history table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            sources TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+    ''')
+    
+    # Summaries table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER,
+            summary TEXT NOT NULL,
+            generated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+    ''')
+    
+    # Background jobs table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_type TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            payload TEXT,
+            progress REAL DEFAULT 0,
+            message TEXT,
+            book_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_priority ON jobs (status, priority DESC, id)')
+
+
+def _migration_history_indexes_and_cascades(cursor):
+    """Index per-book history lookups and delete history and summaries with their book"""
+    # SQLite can't alter a foreign key, so rebuild both child tables with ON DELETE CASCADE.
+    # Rows whose book is already gone would violate the enforced constraint and are dropped.
+    cursor.execute('''
+        CREATE TABLE chat_history_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            sources TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO chat_history_new (id, book_id, question, answer, sources, timestamp)
+        SELECT id, book_id, question, answer, sources, timestamp
+        FROM chat_history
+        WHERE book_id IN (SELECT id FROM books)
+    ''')
+    cursor.execute('DROP TABLE chat_history')
+    cursor.execute('ALTER TABLE chat_history_new RENAME TO chat_history')
+    
+    cursor.execute('''
+        CREATE TABLE summaries_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER,
+            summary TEXT NOT NULL,
+            generated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO summaries_new (id, book_id, summary, generated_date)
+        SELECT id, book_id, summary, generated_date
+        FROM summaries
+        WHERE book_id IN (SELECT id FROM books)
+    ''')
+    cursor.execute('DROP TABLE summaries')
+    cursor.execute('ALTER TABLE summaries_new RENAME TO summaries')
+    
+    cursor.execute('CREATE INDEX idx_chat_history_book_timestamp ON chat_history (book_id, timestamp)')
+    cursor.execute('CREATE INDEX idx_summaries_book_generated ON summaries (book_id, generated_date)')
+    cursor.execute('CREATE INDEX idx_books_last_accessed ON books (last_accessed)')
+
+
+def _migration_library_search(cursor):
+    """Full-text index on book title and filename plus indexes for every library sort order"""
+    try:
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                filename TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                collection_name TEXT NOT NULL,
-                pages INTEGER,
-                total_chars INTEGER,
-                upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            CREATE VIRTUAL TABLE books_fts USING fts5(
+                title, filename, content='books', content_rowid='id'
             )
         ''')
-        
-        # Chat history table
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5: search_books falls back to LIKE
+        print(f"FTS5 unavailable, library search will use LIKE: {e}")
+    else:
+        # Keep the external-content index in sync with books
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chat_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER,
-                question TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                sources TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (book_id) REFERENCES books (id)
-            )
+            CREATE TRIGGER books_fts_insert AFTER INSERT ON books BEGIN
+                INSERT INTO books_fts (rowid, title, filename) VALUES (new.id, new.title, new.filename);
+            END
         ''')
-        
-        # Summaries table
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS summaries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER,
-                summary TEXT NOT NULL,
-                generated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (book_id) REFERENCES books (id)
-            )
+            CREATE TRIGGER books_fts_delete AFTER DELETE ON books BEGIN
+                INSERT INTO books_fts (books_fts, rowid, title, filename) VALUES ('delete', old.id, old.title, old.filename);
+            END
         ''')
+        cursor.execute('''
+            CREATE TRIGGER books_fts_update AFTER UPDATE OF title, filename ON books BEGIN
+                INSERT INTO books_fts (books_fts, rowid, title, filename) VALUES ('delete', old.id, old.title, old.filename);
+                INSERT INTO books_fts (rowid, title, filename) VALUES (new.id, new.title, new.filename);
+            END
+        ''')
+        cursor.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+    
+    cursor.execute('CREATE INDEX idx_books_title ON books (title COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX idx_books_total_chars ON books (total_chars)')
+    cursor.execute('CREATE INDEX idx_books_upload_date ON books (upload_date)')
+
+
+def _migration_answer_cache(cursor):
+    """Cache of generated answers per collection, question, model and prompt version"""
+    cursor.execute('''
+        CREATE TABLE answer_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            collection_name TEXT NOT NULL,
+            question_norm TEXT NOT NULL,
+            model_name TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            sources TEXT,
+            question_embedding BLOB,
+            created_at REAL NOT NULL,
+            last_hit REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX idx_answer_cache_key
+        ON answer_cache (collection_name, model_name, prompt_version, question_norm)
+    ''')
+    cursor.execute('CREATE INDEX idx_answer_cache_last_hit ON answer_cache (last_hit)')
+
+
+def _migration_summary_nodes(cursor):
+    """Intermediate map-reduce summaries per collection, keyed by a hash of their input"""
+    cursor.execute('''
+        CREATE TABLE summary_nodes (
+            collection_name TEXT NOT NULL,
+            input_hash TEXT NOT NULL,
+            level INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (collection_name, input_hash)
+        )
+    ''')
+
+
+def _migration_summary_status(cursor):
+    """Track queued and failed background summaries alongside finished ones"""
+    cursor.execute("ALTER TABLE summaries ADD COLUMN status TEXT NOT NULL DEFAULT 'done'")
+    cursor.execute('CREATE INDEX idx_summaries_book_status ON summaries (book_id, status, generated_date)')
+
+
+# Ordered schema migrations; the applied version is stored in PRAGMA user_version.
+# Append new migrations, never edit or reorder released ones.
+MIGRATIONS = [
+    (1, "initial schema", _migration_initial_schema),
+    (2, "history indexes and cascading deletes", _migration_history_indexes_and_cascades),
+    (3, "library search index", _migration_library_search),
+    (4, "answer cache", _migration_answer_cache),
+    (5, "summary nodes", _migration_summary_nodes),
+    (6, "summary status", _migration_summary_status),
+]
+
+# Library sort options -> ORDER BY clause
+BOOK_SORT_ORDERS = {
+    "Recent": "last_accessed DESC",
+    "Name": "title COLLATE NOCASE",
+    "Size": "total_chars DESC",
+    "Date": "upload_date DESC",
+}
+
+
+def _fts_query(search_term):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    words = search_term.split()
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+class BookDatabase:
+    def __init__(self, db_path="books.db"):
+        self.db_path = db_path
+        self.init_database()
+    
+    def _cursor(self):
+        """Cursor on this thread's pooled connection, committed when the block exits"""
+        return transaction(self.db_path)
+    
+    def get_schema_version(self):
+        """Return the schema version recorded in the database"""
+        with self._cursor() as cursor:
+            cursor.execute('PRAGMA user_version')
+            return cursor.fetchone()[0]
+    
+    def init_database(self):
+        """Bring the database schema up to date by applying pending migrations"""
+        # Cheap check first: BookDatabase is created on every Streamlit rerun
+        if self.get_schema_version() >= SCHEMA_VERSION:
+            return
         
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            # DDL only joins a transaction that is already open; BEGIN IMMEDIATE also
+            # stops two processes from migrating at the same time
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('PRAGMA user_version')
+            current_version = cursor.fetchone()[0]
+            for version, name, migrate in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                print(f"Applying database migration {version}: {name}")
+                migrate(cursor)
+                cursor.execute(f'PRAGMA user_version = {version}')
     
-    def add_book(self, title, filename, file_path, collection_name, pages=0, total_chars=0):
+    def add_book(self, title, filename, file_path, collection_name, pages=0, total_chars=0, content_hash=None):
         """Add a new book to the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO books (title, filename, file_path, collection_name, pages, total_chars)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (title, filename, file_path, collection_name, pages, total_chars))
-        
-        book_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO books (title, filename, file_path, collection_name, pages, total_chars, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (title, filename, file_path, collection_name, pages, total_chars, content_hash))
+            book_id = cursor.lastrowid
         return book_id
     
     def get_all_books(self):
         """Get all books from the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, title, filename, pages, total_chars, upload_date, last_accessed
-            FROM books
-            ORDER BY last_accessed DESC
-        ''')
-        
-        books = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT id, title, filename, pages, total_chars, upload_date, last_accessed
+                FROM books
+                ORDER BY last_accessed DESC
+            ''')
+            books = cursor.fetchall()
         return books
     
+    def get_collections(self):
+        """Get each processed vector store collection with the ID and title of the oldest book using it"""
+        with self._cursor() as cursor:
+            # SQLite takes the bare columns from the row that MIN() picked
+            cursor.execute('''
+                SELECT collection_name, MIN(id), title
+                FROM books
+                WHERE pages > 0
+                GROUP BY collection_name
+            ''')
+            collections = cursor.fetchall()
+        return collections
+    
+    def _book_filter(self, cursor, search_term):
+        """Return the WHERE clause and parameters that restrict books to a search term"""
+        if not search_term or not search_term.strip():
+            return "", []
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'books_fts'")
+        if cursor.fetchone():
+            return "WHERE id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)", [_fts_query(search_term)]
+        pattern = f"%{search_term.strip()}%"
+        return "WHERE title LIKE ? OR filename LIKE ?", [pattern, pattern]
+    
+    def search_books(self, search_term=None, sort_by="Recent", limit=None, offset=0):
+        """
+        Get one page of books matching a search over title and filename
+        Returns rows shaped like get_all_books()
+        """
+        order_by = BOOK_SORT_ORDERS.get(sort_by, BOOK_SORT_ORDERS["Recent"])
+        with self._cursor() as cursor:
+            where, params = self._book_filter(cursor, search_term)
+            cursor.execute(f'''
+                SELECT id, title, filename, pages, total_chars, upload_date, last_accessed
+                FROM books
+                {where}
+                ORDER BY {order_by}, id DESC
+                LIMIT ? OFFSET ?
+            ''', params + [limit if limit is not None else -1, offset])
+            return cursor.fetchall()
+    
+    def count_books(self, search_term=None):
+        """Count the books matching a search over title and filename"""
+        with self._cursor() as cursor:
+            where, params = self._book_filter(cursor, search_term)
+            cursor.execute(f'SELECT COUNT(*) FROM books {where}', params)
+            return cursor.fetchone()[0]
+    
     def get_book_by_id(self, book_id):
         """Get a specific book by ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, title, filename, file_path, collection_name, pages, total_chars, upload_date
-            FROM books
-            WHERE id = ?
-        ''', (book_id,))
-        
-        book = cursor.fetchone()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT id, title, filename, file_path, collection_name, pages, total_chars, upload_date
+                FROM books
+                WHERE id = ?
+            ''', (book_id,))
+            book = cursor.fetchone()
+        return book
+    
+    def add_duplicate_book(self, existing_book, title, filename, content_hash):
+        """Add a book record that shares the file, collection and latest summary of an existing book"""
+        existing_id, _, _, file_path, collection_name, pages, total_chars, _ = existing_book
+        book_id = self.add_book(
+            title=title,
+            filename=filename,
+            file_path=file_path,
+            collection_name=collection_name,
+            pages=pages,
+            total_chars=total_chars,
+            content_hash=content_hash
+        )
+        existing_summary = self.get_latest_summary(existing_id)
+        if existing_summary:
+            self.add_summary(book_id, existing_summary[0])
+        return book_id
+    
+    def find_book_by_hash(self, content_hash):
+        """Get the oldest book whose file has the given content hash"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT id, title, filename, file_path, collection_name, pages, total_chars, upload_date
+                FROM books
+                WHERE content_hash = ?
+                ORDER BY id
+                LIMIT 1
+            ''', (content_hash,))
+            book = cursor.fetchone()
         return book
     
     def update_last_accessed(self, book_id):
         """Update the last accessed timestamp for a book"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE books
-            SET last_accessed = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (book_id,))
-        
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                UPDATE books
+                SET last_accessed = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (book_id,))
     
     def add_chat_history(self, book_id, question, answer, sources=None):
         """Add a chat interaction to the history"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        sources_json = json.dumps(sources) if sources else None
-        
-        cursor.execute('''
-            INSERT INTO chat_history (book_id, question, answer, sources)
-            VALUES (?, ?, ?, ?)
-        ''', (book_id, question, answer, sources_json))
-        
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            sources_json = json.dumps(sources) if sources else None
+            cursor.execute('''
+                INSERT INTO chat_history (book_id, question, answer, sources)
+                VALUES (?, ?, ?, ?)
+            ''', (book_id, question, answer, sources_json))
     
     def get_chat_history(self, book_id, limit=50):
         """Get chat history for a specific book"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT question, answer, sources, timestamp
-            FROM chat_history
-            WHERE book_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (book_id, limit))
-        
-        history = cursor.fetchall()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT question, answer, sources, timestamp
+                FROM chat_history
+                WHERE book_id = ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            ''', (book_id, limit))
+            history = cursor.fetchall()
         return history
     
+    def count_chat_history(self, book_id):
+        """Count the chat interactions for a book"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT COUNT(*)
+                FROM chat_history
+                WHERE book_id = ?
+            ''', (book_id,))
+            return cursor.fetchone()[0]
+    
+    def get_chat_counts(self):
+        """Get a dict of book ID -> number of chat interactions"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT book_id, COUNT(*)
+                FROM chat_history
+                GROUP BY book_id
+            ''')
+            return dict(cursor.fetchall())
+    
+    @staticmethod
+    def _fetch_library_stats(cursor):
+        cursor.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM books),
+                (SELECT COALESCE(SUM(pages), 0) FROM books),
+                (SELECT COALESCE(SUM(total_chars), 0) FROM books),
+                (SELECT COUNT(*) FROM chat_history)
+        ''')
+        total_books, total_pages, total_chars, total_chats = cursor.fetchone()
+        return {
+            "total_books": total_books,
+            "total_pages": total_pages,
+            "total_chars": total_chars,
+            "total_chats": total_chats,
+        }
+    
+    def get_library_stats(self):
+        """Get library-wide totals in a single query"""
+        with self._cursor() as cursor:
+            return self._fetch_library_stats(cursor)
+    
+    def get_library_analytics(self, top_n=5):
+        """
+        Get everything the analytics page shows in one call: library totals, the
+        largest books and the most recently accessed books with their chat counts
+        """
+        with self._cursor() as cursor:
+            analytics = self._fetch_library_stats(cursor)
+            
+            cursor.execute('''
+                SELECT title, COALESCE(total_chars, 0)
+                FROM books
+                ORDER BY total_chars DESC
+                LIMIT ?
+            ''', (top_n,))
+            analytics["largest_books"] = cursor.fetchall()
+            
+            cursor.execute('''
+                SELECT b.id, b.title, b.last_accessed, COUNT(c.id)
+                FROM (SELECT id, title, last_accessed FROM books ORDER BY last_accessed DESC LIMIT ?) AS b
+                LEFT JOIN chat_history c ON c.book_id = b.id
+                GROUP BY b.id
+                ORDER BY b.last_accessed DESC
+            ''', (top_n,))
+            analytics["recent_books"] = cursor.fetchall()
+        return analytics
+    
     def add_summary(self, book_id, summary):
         """Add a generated summary"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO summaries (book_id, summary)
-            VALUES (?, ?)
-        ''', (book_id, summary))
-        
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO summaries (book_id, summary)
+                VALUES (?, ?)
+            ''', (book_id, summary))
+    
+    def add_pending_summary(self, book_id):
+        """Record a summary that will be generated in the background and return its ID"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO summaries (book_id, summary, status)
+                VALUES (?, '', 'pending')
+            ''', (book_id,))
+            summary_id = cursor.lastrowid
+        return summary_id
+    
+    def update_summary(self, summary_id, status, summary=None):
+        """Set the status of a background summary, storing its text once it is done"""
+        with self._cursor() as cursor:
+            if summary is None:
+                cursor.execute('UPDATE summaries SET status = ? WHERE id = ?', (status, summary_id))
+            else:
+                cursor.execute('''
+                    UPDATE summaries
+                    SET status = ?, summary = ?, generated_date = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (status, summary, summary_id))
+    
+    def add_waiting_summary(self, book_id, collection_name):
+        """
+        Record a pending summary for a book if another book on the same collection
+        already has one pending or running; that summary's result is copied to it.
+        Returns the summary ID, or None if no summary of the collection is in progress.
+        """
+        with self._cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO summaries (book_id, summary, status)
+                SELECT ?, '', 'pending'
+                WHERE EXISTS (
+                    SELECT 1
+                    FROM summaries s JOIN books b ON b.id = s.book_id
+                    WHERE b.collection_name = ? AND s.book_id != ? AND s.status IN ('pending', 'running')
+                )
+            ''', (book_id, collection_name, book_id))
+            summary_id = cursor.lastrowid if cursor.rowcount else None
+        return summary_id
+    
+    def update_collection_summaries(self, summary_id, collection_name, status, summary=None):
+        """
+        Finish a background summary and the pending summaries waiting on it: those of
+        books sharing its collection that have no summary job of their own
+        """
+        with self._cursor() as cursor:
+            cursor.execute('''
+                UPDATE summaries
+                SET status = ?, summary = COALESCE(?, summary), generated_date = CURRENT_TIMESTAMP
+                WHERE id = ? OR (
+                    status = 'pending'
+                    AND book_id IN (SELECT id FROM books WHERE collection_name = ?)
+                    AND book_id NOT IN (
+                        SELECT book_id FROM jobs
+                        WHERE job_type = 'summary' AND status IN ('queued', 'running') AND book_id IS NOT NULL
+                    )
+                )
+            ''', (status, summary, summary_id, collection_name))
     
     def get_latest_summary(self, book_id):
-        """Get the latest summary for a book"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT summary, generated_date
-            FROM summaries
-            WHERE book_id = ?
-            ORDER BY generated_date DESC
-            LIMIT 1
-        ''', (book_id,))
-        
-        summary = cursor.fetchone()
-        conn.close()
+        """Get the latest finished summary for a book"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT summary, generated_date
+                FROM summaries
+                WHERE book_id = ? AND status = 'done'
+                ORDER BY generated_date DESC
+                LIMIT 1
+            ''', (book_id,))
+            summary = cursor.fetchone()
         return summary
     
+    def get_summary_status(self, book_id):
+        """Get the status of the most recently requested summary for a book, or None"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT status
+                FROM summaries
+                WHERE book_id = ?
+                ORDER BY id DESC
+                LIMIT 1
+            ''', (book_id,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+    
     def delete_book(self, book_id):
         """Delete a book and all associated data"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get book info before deletion
-        cursor.execute('SELECT file_path, collection_name FROM books WHERE id = ?', (book_id,))
-        book_info = cursor.fetchone()
-        
-        # Delete chat history
-        cursor.execute('DELETE FROM chat_history WHERE book_id = ?', (book_id,))
-        
-        # Delete summaries
-        cursor.execute('DELETE FROM summaries WHERE book_id = ?', (book_id,))
-        
-        # Delete book
-        cursor.execute('DELETE FROM books WHERE id = ?', (book_id,))
-        
-        conn.commit()
-        conn.close()
+        with self._cursor() as cursor:
+            # Get book info before deletion
+            cursor.execute('SELECT file_path, collection_name FROM books WHERE id = ?', (book_id,))
+            book_info = cursor.fetchone()
+            
+            # Delete book; chat history and summaries follow via ON DELETE CASCADE
+            cursor.execute('DELETE FROM books WHERE id = ?', (book_id,))
+            
+            # Duplicate uploads share the file and collection of the original book
+            file_shared = collection_shared = False
+            if book_info:
+                cursor.execute('SELECT COUNT(*) FROM books WHERE file_path = ?', (book_info[0],))
+                file_shared = cursor.fetchone()[0] > 0
+                cursor.execute('SELECT COUNT(*) FROM books WHERE collection_name = ?', (book_info[1],))
+                collection_shared = cursor.fetchone()[0] > 0
         
         # Delete physical files if they exist
         if book_info:
             file_path, collection_name = book_info
             
+            # Drop any open handle and cached answers so a stale collection is never served
+            if not collection_shared:
+                vector_store_pool.invalidate(collection_name)
+                with self._cursor() as cursor:
+                    cursor.execute('DELETE FROM answer_cache WHERE collection_name = ?', (collection_name,))
+                    cursor.execute('DELETE FROM summary_nodes WHERE collection_name = ?', (collection_name,))
+            
             # Delete the PDF file
             try:
-                if os.path.exists(file_path):
+                if not file_shared and os.path.exists(file_path):
                     os.remove(file_path)
                     print(f"Deleted file: {file_path}")
             except Exception as e:
                 print(f"Error deleting file {file_path}: {e}")
             
-            # Delete vector store collection
+            # Delete vector store collection, whichever backend holds it
+            for collection_path in (f"./chroma_db/{collection_name}", numpy_store_path("./chroma_db", collection_name)):
+                try:
+                    import shutil
+                    if not collection_shared and os.path.exists(collection_path):
+                        shutil.rmtree(collection_path)
+                        print(f"Deleted vector store: {collection_path}")
+                except Exception as e:
+                    print(f"Error deleting vector store {collection_path}: {e}")
+            
+            # Delete the collection's keyword index
             try:
-                import shutil
-                collection_path = f"./chroma_db/{collection_name}"
-                if os.path.exists(collection_path):
-                    shutil.rmtree(collection_path)
-                    print(f"Deleted vector store: {collection_path}")
+                if not collection_shared:
+                    LexicalIndex("./chroma_db", collection_name).drop()
             except Exception as e:
-                print(f"Error deleting vector store {collection_path}: {e}") 
\ No newline at end of file
+                print(f"Error deleting lexical index for {collection_name}: {e}")
+    
+    def add_job(self, job_type, payload=None, priority=0, book_id=None):
+        """Queue a background job and return its ID"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO jobs (job_type, payload, priority, book_id)
+                VALUES (?, ?, ?, ?)
+            ''', (job_type, json.dumps(payload) if payload is not None else None, priority, book_id))
+            job_id = cursor.lastrowid
+        return job_id
+    
+    def claim_next_job(self):
+        """Atomically mark the highest-priority queued job as running and return it"""
+        with self._cursor() as cursor:
+            # BEGIN IMMEDIATE takes the write lock so two workers can't claim the same job
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT id, job_type, payload, book_id
+                FROM jobs
+                WHERE status = 'queued'
+                ORDER BY priority DESC, id
+                LIMIT 1
+            ''')
+            job = cursor.fetchone()
+            if job:
+                cursor.execute('''
+                    UPDATE jobs
+                    SET status = 'running', started_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (job[0],))
+        
+        if not job:
+            return None
+        job_id, job_type, payload, book_id = job
+        return job_id, job_type, json.loads(payload) if payload else {}, book_id
+    
+    def update_job(self, job_id, status=None, progress=None, message=None, book_id=None):
+        """Update the status, progress, message or book of a job"""
+        fields = []
+        values = []
+        if status is not None:
+            fields.append('status = ?')
+            values.append(status)
+            if status in ('done', 'failed'):
+                fields.append('finished_at = CURRENT_TIMESTAMP')
+        if progress is not None:
+            fields.append('progress = ?')
+            values.append(progress)
+        if message is not None:
+            fields.append('message = ?')
+            values.append(message)
+        if book_id is not None:
+            fields.append('book_id = ?')
+            values.append(book_id)
+        if not fields:
+            return
+        
+        with self._cursor() as cursor:
+            cursor.execute(f'''
+                UPDATE jobs
+                SET {', '.join(fields)}
+                WHERE id = ?
+            ''', values + [job_id])
+    
+    def get_job(self, job_id):
+        """Get a job by ID"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT id, job_type, status, progress, message, book_id, created_at, finished_at
+                FROM jobs
+                WHERE id = ?
+            ''', (job_id,))
+            job = cursor.fetchone()
+        return job
+    
+    def get_recent_jobs(self, limit=20):
+        """Get active jobs followed by the most recently created finished ones"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT id, job_type, status, progress, message, book_id, created_at, finished_at
+                FROM jobs
+                ORDER BY status NOT IN ('queued', 'running'), id DESC
+                LIMIT ?
+            ''', (limit,))
+            jobs = cursor.fetchall()
+        return jobs
+    
+    def requeue_running_jobs(self):
+        """Put jobs left running by a previous process back in the queue"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                UPDATE jobs
+                SET status = 'queued', progress = 0, started_at = NULL
+                WHERE status = 'running'
+            ''')
+            count = cursor.rowcount
+        return count
@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from core.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, QUERY_EMBEDDING_CACHE_SIZE
+from core.connection_pool import transaction
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def hash_text(text):
+    """Return the cache key for a chunk of text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model name, chunk text hash).
+    Vectors are stored as float32 blobs; the least recently used entries are
+    evicted once the cache grows past max_entries.
+    """
+
+    def __init__(self, db_path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.init_database()
+
+    def init_database(self):
+        """Initialize the cache table"""
+        with transaction(self.db_path) as cursor:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model_name TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model_name, text_hash)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)')
+
+    def get_many(self, model_name, texts):
+        """Return a list with the cached vector for each text, or None on a miss"""
+        hashes = [hash_text(text) for text in texts]
+        found = {}
+        with transaction(self.db_path) as cursor:
+            for start in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f'''
+                    SELECT text_hash, vector FROM embeddings
+                    WHERE model_name = ? AND text_hash IN ({placeholders})
+                ''', [model_name] + batch)
+                for text_hash, blob in cursor.fetchall():
+                    found[text_hash] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                cursor.executemany(
+                    'UPDATE embeddings SET last_used = ? WHERE model_name = ? AND text_hash = ?',
+                    [(now, model_name, text_hash) for text_hash in found]
+                )
+        return [found.get(text_hash) for text_hash in hashes]
+
+    def put_many(self, model_name, texts, vectors):
+        """Store vectors for texts and evict old entries if the cache is over its bound"""
+        now = time.time()
+        with transaction(self.db_path) as cursor:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO embeddings (model_name, text_hash, vector, last_used)
+                VALUES (?, ?, ?, ?)
+            ''', [(model_name, hash_text(text), array("f", vector).tobytes(), now)
+                  for text, vector in zip(texts, vectors)])
+            self._evict(cursor)
+
+    def _evict(self, cursor):
+        """Trim the cache to 90% of max_entries, oldest entries first"""
+        cursor.execute('SELECT COUNT(*) FROM embeddings')
+        count = cursor.fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * 0.9)
+        cursor.execute('''
+            DELETE FROM embeddings WHERE rowid IN (
+                SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?
+            )
+        ''', (excess,))
+        logger.info(f"Evicted {excess} entries from the embedding cache")
+
+    def count(self):
+        """Return the number of cached vectors"""
+        with transaction(self.db_path) as cursor:
+            cursor.execute('SELECT COUNT(*) FROM embeddings')
+            return cursor.fetchone()[0]
+
+
+class CachedEmbeddings:
+    """Wrap an embedding model so embed_documents only encodes texts missing from the cache"""
+
+    def __init__(self, embeddings, model_name, cache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = self.embeddings.embed_documents(missing_texts)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+            self.cache.put_many(self.model_name, missing_texts, encoded)
+        return vectors
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+def normalize_query(text):
+    """Collapse whitespace so trivially different spellings of a question share a cache entry"""
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """In-process LRU of query embeddings keyed by (model name, normalized text)"""
+
+    def __init__(self, max_entries=QUERY_EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name, text):
+        """Return the cached vector for text, or None"""
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_name, text, vector):
+        if self.max_entries <= 0:
+            return
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            self._entries[key] = tuple(vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return size and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+query_embedding_cache = QueryEmbeddingCache()
+
+
+class QueryCachedEmbeddings(Embeddings):
+    """Wrap an embedding model so repeated queries skip the encoder"""
+
+    def __init__(self, embeddings, model_name, cache=query_embedding_cache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        vector = self.cache.get(self.model_name, text)
+        if vector is None:
+            vector = self.embeddings.embed_query(normalize_query(text))
+            self.cache.put(self.model_name, text, vector)
+        # Callers get their own list so the cached vector can't be modified
+        return list(vector)
+
+
+_default_cache = None
+
+
+def get_embedding_cache():
+    """Return the process-wide embedding cache, or None when it is disabled"""
+    global _default_cache
+    if EMBEDDING_CACHE_MAX_ENTRIES <= 0:
+        return None
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
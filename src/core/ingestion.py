@@ -0,0 +1,126 @@
+import logging
+import time
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from core.config import EMBED_BATCH_SIZE, EMBED_NUM_THREADS
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionStats:
+    """Running counters for one ingestion run"""
+
+    def __init__(self, total_pages=None):
+        self.total_pages = total_pages
+        self.pages = 0
+        self.last_page = 0
+        self.chars = 0
+        self.chunks = 0
+        self.batches = 0
+        self.batch_chunks_per_second = 0.0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_second(self):
+        elapsed = self.elapsed
+        return self.chunks / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def progress(self):
+        """Fraction of the book processed, or None when the page count is unknown"""
+        if not self.total_pages:
+            return None
+        return min(1.0, self.last_page / self.total_pages)
+
+
+class IngestionEngine:
+    """
+    Split pages into chunks and embed them into a vector store in batches.
+    Each batch is encoded and written before the next one is split, so memory
+    stays bounded and progress can be reported as the book is ingested.
+    Backends that build their index in one pass (NumpyFlatStore) stage each
+    batch on disk and merge the batches when the run ends with flush().
+    """
+
+    def __init__(self, embeddings, batch_size=EMBED_BATCH_SIZE, num_threads=EMBED_NUM_THREADS,
+                 chunk_size=1000, chunk_overlap=200):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+        if num_threads:
+            set_torch_threads(num_threads)
+
+    def iter_batches(self, pages, stats):
+        """Yield lists of (text, metadata) of at most batch_size chunks"""
+        batch = []
+        for page_num, text in pages:
+            stats.pages += 1
+            stats.last_page = page_num
+            stats.chars += len(text)
+            for chunk in self.text_splitter.split_text(text):
+                batch.append((chunk, {"page": page_num}))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def run(self, pages, vector_store, progress_callback=None, total_pages=None, lexical_index=None):
+        """
+        pages: iterable of (page_num, text), e.g. a lazy page generator
+        progress_callback: optional callable receiving the IngestionStats after each batch
+        total_pages: page count of the book, used for progress when pages is a generator
+        lexical_index: optional LexicalIndex that receives every batch alongside the vector store
+        Returns: IngestionStats
+        """
+        if total_pages is None and isinstance(pages, (list, tuple)) and pages:
+            total_pages = pages[-1][0]
+        stats = IngestionStats(total_pages=total_pages)
+
+        for batch in self.iter_batches(pages, stats):
+            batch_start = time.perf_counter()
+            texts = [text for text, _ in batch]
+            metadatas = [metadata for _, metadata in batch]
+            ids = [f"chunk_{stats.chunks + i}" for i in range(len(batch))]
+
+            vectors = self.embeddings.embed_documents(texts)
+            vector_store.upsert_chunks(
+                ids=ids,
+                embeddings=vectors,
+                documents=texts,
+                metadatas=metadatas,
+            )
+            if lexical_index is not None:
+                lexical_index.add(ids, texts, metadatas)
+
+            batch_seconds = time.perf_counter() - batch_start
+            stats.chunks += len(batch)
+            stats.batches += 1
+            stats.batch_chunks_per_second = len(batch) / batch_seconds if batch_seconds > 0 else 0.0
+            logger.info(
+                f"Embedded batch {stats.batches}: {len(batch)} chunks "
+                f"({stats.batch_chunks_per_second:.1f} chunks/s, {stats.chunks} total)"
+            )
+            if progress_callback:
+                progress_callback(stats)
+
+        vector_store.flush()
+        return stats
+
+
+def set_torch_threads(num_threads):
+    """Limit the CPU threads torch uses for encoding"""
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        logger.warning("torch is not installed, ignoring EMBED_NUM_THREADS")
@@ -0,0 +1,249 @@
+import logging
+import os
+import threading
+
+from core.config import INGEST_WORKERS, JOB_POLL_INTERVAL
+from core.database import BookDatabase
+from core.rag_chain import chunk_and_embed, get_ollama_llm, get_summary_chain, get_vector_store
+from core.vector_store_pool import vector_store_pool
+from utils.pdf_utils import iter_text_from_pdf, get_pdf_page_count
+
+logger = logging.getLogger(__name__)
+
+INGEST_JOB = "ingest"
+SUMMARY_JOB = "summary"
+
+# Claim order of queued jobs (highest first): uploads first so books become
+# searchable quickly, summaries somebody asked for next, automatic post-upload
+# summaries last
+INGEST_PRIORITY = 0
+SUMMARY_PRIORITY = -10
+REQUESTED_SUMMARY_PRIORITY = -5
+
+
+def run_ingest_job(db, job_id, payload):
+    """
+    Extract and embed an uploaded PDF, then queue its summary as a separate job.
+    payload: dict with file_path, filename, collection_name and content_hash
+    Returns: the new book ID
+    """
+    file_path = payload["file_path"]
+    filename = payload["filename"]
+    collection_name = payload["collection_name"]
+    content_hash = payload.get("content_hash")
+    
+    # An identical file may have been ingested while this job was queued
+    existing_book = db.find_book_by_hash(content_hash) if content_hash else None
+    if existing_book:
+        logger.info(f"{filename} matches book_id={existing_book[0]}, reusing collection {existing_book[4]}")
+        book_id = db.add_duplicate_book(existing_book, filename.replace('.pdf', ''), filename, content_hash)
+        if existing_book[3] != file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        if queue_duplicate_summary(db, book_id, existing_book[4]):
+            db.update_job(job_id, message="Reused existing content, summary queued")
+        else:
+            db.update_job(job_id, message="Reused existing content")
+        return book_id
+    
+    db.update_job(job_id, message="Extracting and embedding")
+    
+    def report(stats):
+        db.update_job(
+            job_id,
+            progress=stats.progress,
+            message=(
+                f"Embedding: {stats.chunks:,} chunks from {stats.pages:,} pages "
+                f"({stats.batch_chunks_per_second:.1f} chunks/s)"
+            )
+        )
+    
+    try:
+        total_pages = get_pdf_page_count(file_path)
+    except Exception as e:
+        # iter_text_from_pdf falls back to pdfminer for files PyPDF2 can't parse
+        logger.warning(f"Could not count pages of {filename}, progress will be approximate: {e}")
+        total_pages = None
+    
+    logger.info(f"Extracting, embedding and storing vector store for: {collection_name}")
+    vector_store, stats = chunk_and_embed(
+        iter_text_from_pdf(file_path),
+        persist_directory="./chroma_db",
+        collection_name=collection_name,
+        progress_callback=report,
+        total_pages=total_pages,
+        return_stats=True
+    )
+    if stats.chunks == 0:
+        vector_store.delete_collection()
+        vector_store_pool.invalidate(collection_name)
+        raise ValueError(f"No extractable text found in {filename}")
+    
+    book_id = db.add_book(
+        title=filename.replace('.pdf', ''),
+        filename=filename,
+        file_path=file_path,
+        collection_name=collection_name,
+        pages=stats.pages,
+        total_chars=stats.chars,
+        content_hash=content_hash
+    )
+    queue_summary(db, book_id)
+    db.update_job(job_id, message="Processed, summary queued", book_id=book_id)
+    return book_id
+
+
+def queue_summary(db, book_id, priority=SUMMARY_PRIORITY):
+    """Record a pending summary for a book and queue the job that generates it. Returns the job ID."""
+    summary_id = db.add_pending_summary(book_id)
+    return db.add_job(SUMMARY_JOB, {"book_id": book_id, "summary_id": summary_id}, priority=priority, book_id=book_id)
+
+
+def queue_duplicate_summary(db, book_id, collection_name):
+    """
+    Give a book that shares another book's collection a summary.
+    Nothing is queued if it already has one or a summary of the collection is
+    still in progress; that job's result is copied to the book when it finishes.
+    Returns the job ID, or None if no job was queued.
+    """
+    if db.get_latest_summary(book_id) or db.add_waiting_summary(book_id, collection_name):
+        return None
+    return queue_summary(db, book_id)
+
+
+def run_summary_job(db, job_id, payload):
+    """
+    Generate the summary recorded as pending by queue_summary.
+    payload: dict with book_id and summary_id
+    Returns: the book ID
+    """
+    book_id = payload["book_id"]
+    summary_id = payload["summary_id"]
+    book_info = db.get_book_by_id(book_id)
+    if not book_info:
+        # Deleted while queued; its summary row went with it
+        db.update_job(job_id, message="Book was deleted")
+        return None
+    
+    db.update_summary(summary_id, "running")
+    db.update_job(job_id, message=f"Summarizing {book_info[1]}")
+    try:
+        vector_store = get_vector_store(persist_directory="./chroma_db", collection_name=book_info[4])
+        if not vector_store:
+            raise ValueError(f"Could not load vector store for {book_info[1]}")
+        
+        llm = get_ollama_llm()
+        summary_chain = get_summary_chain(vector_store, llm, db_path=db.db_path)
+        logger.info(f"Generating summary for {book_info[1]} (book_id={book_id})")
+        summary_result = summary_chain()
+        summary = summary_result['result'] if isinstance(summary_result, dict) else str(summary_result)
+        if not summary:
+            raise ValueError("Summary chain returned no summary")
+    except Exception:
+        db.update_collection_summaries(summary_id, book_info[4], "failed")
+        raise
+    
+    # Duplicate uploads of the same file waiting on this summary get it too
+    db.update_collection_summaries(summary_id, book_info[4], "done", summary=summary)
+    db.update_job(job_id, message="Summary generated")
+    logger.info(f"Summary generated and stored for {book_info[1]} (book_id={book_id})")
+    return book_id
+
+
+class JobQueue:
+    """
+    Worker threads that run jobs persisted in the jobs table of books.db.
+    Jobs survive restarts: anything left running by a dead process is queued again on start.
+    """
+    
+    def __init__(self, db_path="books.db", num_workers=INGEST_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+        self.db = BookDatabase(db_path)
+        self.num_workers = max(1, num_workers)
+        self.poll_interval = poll_interval
+        self.handlers = {INGEST_JOB: run_ingest_job, SUMMARY_JOB: run_summary_job}
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """Start the worker threads once"""
+        with self._lock:
+            if self._threads:
+                return
+            requeued = self.db.requeue_running_jobs()
+            if requeued:
+                logger.info(f"Requeued {requeued} interrupted job(s)")
+            self._stop.clear()
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+    
+    def stop(self, timeout=None):
+        """Ask the workers to exit after their current job and wait for them"""
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+    
+    def submit(self, job_type, payload=None, priority=0):
+        """Queue a job and wake an idle worker. Returns the job ID."""
+        job_id = self.db.add_job(job_type, payload, priority=priority)
+        self._wakeup.set()
+        return job_id
+    
+    def submit_summary(self, book_id, priority=REQUESTED_SUMMARY_PRIORITY):
+        """Queue a summary for a book and wake an idle worker. Returns the job ID."""
+        job_id = queue_summary(self.db, book_id, priority=priority)
+        self._wakeup.set()
+        return job_id
+    
+    def submit_duplicate_summary(self, book_id, collection_name):
+        """Queue a summary for a duplicate upload if one is needed (see queue_duplicate_summary)"""
+        job_id = queue_duplicate_summary(self.db, book_id, collection_name)
+        if job_id:
+            self._wakeup.set()
+        return job_id
+    
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.db.claim_next_job()
+            except Exception as e:
+                logger.exception(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.run_job(*job)
+    
+    def run_job(self, job_id, job_type, payload, book_id=None):
+        """Run a claimed job and record its outcome"""
+        handler = self.handlers.get(job_type)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job type: {job_type}")
+            logger.info(f"Running {job_type} job {job_id}")
+            result_book_id = handler(self.db, job_id, payload)
+            self.db.update_job(job_id, status='done', progress=1.0, book_id=result_book_id)
+            logger.info(f"{job_type} job {job_id} finished")
+        except Exception as e:
+            logger.exception(f"{job_type} job {job_id} failed: {e}")
+            self.db.update_job(job_id, status='failed', message=str(e))
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue, starting its workers on first use"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+            _job_queue.start()
+        return _job_queue
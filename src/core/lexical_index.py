@@ -0,0 +1,108 @@
+import logging
+import os
+import re
+import sqlite3
+
+from core.connection_pool import transaction
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILENAME = "lexical_index.db"
+
+
+def lexical_index_path(persist_directory):
+    """Path of the FTS5 database kept next to the Chroma data in persist_directory"""
+    return os.path.join(persist_directory, LEXICAL_INDEX_FILENAME)
+
+
+def _match_query(text):
+    """Turn free text into an FTS5 query matching any of its words"""
+    words = [word for word in re.findall(r"\w+", text.lower()) if len(word) > 1]
+    return " OR ".join('"' + word + '"' for word in dict.fromkeys(words))
+
+
+def _chunk_rowid(chunk_id):
+    match = re.fullmatch(r"chunk_(\d+)", chunk_id)
+    return int(match.group(1)) if match else None
+
+
+class LexicalIndex:
+    """
+    BM25 keyword index over the chunks of one collection, in an SQLite FTS5 table.
+    Every collection gets its own table so term statistics are per book.
+    """
+
+    def __init__(self, persist_directory, collection_name):
+        self.db_path = lexical_index_path(persist_directory)
+        self.collection_name = collection_name
+        self.table = '"chunks_' + re.sub(r"\W", "_", collection_name) + '"'
+
+    def _ensure_table(self, cursor):
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {self.table}
+            USING fts5(content, chunk_id UNINDEXED, page UNINDEXED, tokenize='porter unicode61')
+        ''')
+
+    def exists(self):
+        """True once anything has been indexed for this collection"""
+        if not os.path.exists(self.db_path):
+            return False
+        with transaction(self.db_path) as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.table.strip('"'),)
+            )
+            return cursor.fetchone() is not None
+
+    def add(self, ids, documents, metadatas):
+        """Index chunks, replacing any chunk already stored under the same ID"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        rows = [
+            (_chunk_rowid(chunk_id), document, chunk_id, (metadata or {}).get("page"))
+            for chunk_id, document, metadata in zip(ids, documents, metadatas)
+        ]
+        with transaction(self.db_path) as cursor:
+            self._ensure_table(cursor)
+            # Chunk IDs from the ingestion engine map onto rowids so re-indexing replaces in place
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, content, chunk_id, page) VALUES (?, ?, ?, ?)', rows
+            )
+
+    def search(self, query, k):
+        """Return up to k (chunk_id, content, page) tuples, best BM25 match first"""
+        match = _match_query(query)
+        if not match or not self.exists():
+            return []
+        with transaction(self.db_path) as cursor:
+            try:
+                cursor.execute(f'''
+                    SELECT chunk_id, content, page
+                    FROM {self.table}
+                    WHERE {self.table} MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                ''', (match, k))
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Lexical search failed for {self.collection_name}: {e}")
+                return []
+            return cursor.fetchall()
+
+    def count(self):
+        if not self.exists():
+            return 0
+        with transaction(self.db_path) as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+    def drop(self):
+        """Delete the collection's index"""
+        if not os.path.exists(self.db_path):
+            return
+        with transaction(self.db_path) as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def rebuild_from(self, vector_store):
+        """Index every chunk already stored in a vector store (for collections ingested before this index existed)"""
+        ids, documents, metadatas = vector_store.get_chunks()
+        if ids:
+            self.add(ids, documents, metadatas)
+        logger.info(f"Built lexical index for {self.collection_name} ({len(ids)} chunks)")
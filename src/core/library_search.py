@@ -0,0 +1,59 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import LIBRARY_SEARCH_K, LIBRARY_SEARCH_WORKERS
+from core.rag_chain import get_embeddings, get_vector_store
+
+logger = logging.getLogger(__name__)
+
+
+def _search_collection(persist_directory, collection_name, query_vector, k):
+    """Return [(document, distance)] for the k passages of one collection closest to query_vector"""
+    vector_store = get_vector_store(persist_directory=persist_directory, collection_name=collection_name)
+    if vector_store is None:
+        return []
+    return vector_store.similarity_search_by_vector_with_relevance_scores(query_vector, k=k)
+
+
+def search_library(db, question, k=LIBRARY_SEARCH_K, max_workers=LIBRARY_SEARCH_WORKERS,
+                   persist_directory="./chroma_db", embed_query=None):
+    """
+    Search every book in the library for passages relevant to a question.
+    The question is embedded once and every collection is queried concurrently;
+    all books share one embedding model, so distances are comparable and the
+    per-book results merge into a single top k.
+    Returns: list of dicts with book_id, title, collection_name, page, content and
+    distance, closest first
+    """
+    collections = db.get_collections()
+    if not collections or not question.strip():
+        return []
+
+    if embed_query is None:
+        embed_query = get_embeddings().embed_query
+    query_vector = embed_query(question)
+
+    def search(collection):
+        collection_name, book_id, title = collection
+        try:
+            results = _search_collection(persist_directory, collection_name, query_vector, k)
+        except Exception as e:
+            logger.warning(f"Library search skipped {collection_name}: {e}")
+            return []
+        return [
+            {
+                "book_id": book_id,
+                "title": title,
+                "collection_name": collection_name,
+                "page": doc.metadata.get("page"),
+                "content": doc.page_content,
+                "distance": distance,
+            }
+            for doc, distance in results
+        ]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(collections)))) as executor:
+        hits = [hit for book_hits in executor.map(search, collections) for hit in book_hits]
+
+    hits.sort(key=lambda hit: hit["distance"])
+    return hits[:k]
@@ -0,0 +1,339 @@
+import asyncio
+import contextlib
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+
+import httpx
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from core.config import (
+    OLLAMA_ENDPOINTS, LLM_MAX_CONCURRENCY, LLM_REQUEST_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_MAX_CONNECTIONS,
+    LLM_HEALTH_CHECK_INTERVAL, LLM_FAILOVER_COOLDOWN
+)
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class OllamaClient:
+    """
+    Shared asynchronous client for the Ollama HTTP API.
+    Requests run on a private event loop thread over one keep-alive connection pool.
+    At most max_concurrency generations are in flight; the rest wait in line and
+    are counted by queue_depth. Synchronous callers use generate() and stream().
+    """
+
+    def __init__(self, base_url=None, max_concurrency=LLM_MAX_CONCURRENCY,
+                 timeout=LLM_REQUEST_TIMEOUT, connect_timeout=LLM_CONNECT_TIMEOUT,
+                 max_connections=LLM_MAX_CONNECTIONS):
+        # base_url=None uses the first configured endpoint
+        self.base_url = (base_url or OLLAMA_ENDPOINTS[0]).rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.requests = 0
+        self.errors = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ollama-client", daemon=True)
+        self._thread.start()
+        self._client = self._run(self._create_client(timeout, connect_timeout, max_connections))
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _create_client(self, timeout, connect_timeout, max_connections):
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def _run(self, coro):
+        """Run a coroutine on the client loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    @contextlib.asynccontextmanager
+    async def _slot(self):
+        """Wait for a free generation slot; waiting requests count towards queue_depth"""
+        self.queue_depth += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        finally:
+            self.queue_depth -= 1
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            yield
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def _payload(self, prompt, model, stream, options):
+        payload = {"model": model, "prompt": prompt, "stream": stream}
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def agenerate(self, prompt, model, **options):
+        """Return the full completion for prompt"""
+        async with self._slot():
+            response = await self._client.post("/api/generate", json=self._payload(prompt, model, False, options))
+            response.raise_for_status()
+            return response.json().get("response", "")
+
+    async def astream(self, prompt, model, **options):
+        """Yield completion tokens for prompt as Ollama produces them"""
+        async with self._slot():
+            payload = self._payload(prompt, model, True, options)
+            async with self._client.stream("POST", "/api/generate", json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(f"Ollama error: {data['error']}")
+                    # Read through the final "done" line so the connection goes back to the pool
+                    if data.get("response"):
+                        yield data["response"]
+
+    def generate(self, prompt, model, **options):
+        """Blocking wrapper around agenerate for synchronous callers"""
+        return self._run(self.agenerate(prompt, model, **options))
+
+    def stream(self, prompt, model, **options):
+        """Blocking generator over astream; closing it early cancels the request"""
+        tokens = queue.Queue()
+
+        async def pump():
+            try:
+                async for token in self.astream(prompt, model, **options):
+                    tokens.put(token)
+            except Exception as e:
+                tokens.put(e)
+            finally:
+                tokens.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                item = tokens.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    async def ahealthy(self):
+        """Return True if the server answers its model listing"""
+        try:
+            response = await self._client.get("/api/tags", timeout=self.connect_timeout)
+            return response.status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    def check_health(self):
+        """Blocking wrapper around ahealthy"""
+        return self._run(self.ahealthy())
+
+    def stats(self):
+        """Return current load on the client"""
+        return {
+            "base_url": self.base_url,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+    def close(self):
+        """Close pooled connections and stop the loop thread"""
+        self._run(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def _is_failover_error(error):
+    """Connection failures, timeouts and server errors are worth retrying elsewhere"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class OllamaRouter:
+    """
+    Spreads generations over several Ollama servers, each with its own OllamaClient.
+    Requests go to the healthy endpoint with the fewest outstanding requests per
+    generation slot. An endpoint that fails is taken out of rotation until a health
+    check passes or cooldown seconds have gone by, and the request is
+    retried on the next endpoint. Exposes the same generate/stream API as OllamaClient.
+    """
+
+    def __init__(self, endpoints=OLLAMA_ENDPOINTS, health_check_interval=LLM_HEALTH_CHECK_INTERVAL,
+                 cooldown=LLM_FAILOVER_COOLDOWN, client_factory=OllamaClient):
+        if not endpoints:
+            raise ValueError("At least one Ollama endpoint is required")
+        self.clients = [client_factory(base_url=url) for url in endpoints]
+        self.health_check_interval = health_check_interval
+        self.cooldown = cooldown
+        self._outstanding = {client.base_url: 0 for client in self.clients}
+        self._down_until = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        if health_check_interval > 0:
+            threading.Thread(target=self._health_loop, name="ollama-health", daemon=True).start()
+
+    def _is_healthy(self, client):
+        return time.time() >= self._down_until.get(client.base_url, 0)
+
+    def _load(self, client):
+        """Unhealthy endpoints sort last, the rest by outstanding requests per generation slot"""
+        return not self._is_healthy(client), self._outstanding[client.base_url] / client.max_concurrency
+
+    @contextlib.contextmanager
+    def _next_endpoint(self, tried):
+        """Claim the least loaded endpoint not tried yet, counting it as outstanding while in use"""
+        with self._lock:
+            client = min((c for c in self.clients if c.base_url not in tried), key=self._load)
+            self._outstanding[client.base_url] += 1
+        tried.add(client.base_url)
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._outstanding[client.base_url] -= 1
+
+    def _mark_down(self, client, error):
+        logger.warning(f"Ollama endpoint {client.base_url} failed, failing over: {error}")
+        with self._lock:
+            self._down_until[client.base_url] = time.time() + self.cooldown
+
+    def generate(self, prompt, model, **options):
+        """Return the full completion from the least loaded healthy endpoint"""
+        last_error = None
+        tried = set()
+        for _ in self.clients:
+            with self._next_endpoint(tried) as client:
+                try:
+                    return client.generate(prompt, model, **options)
+                except Exception as e:
+                    if not _is_failover_error(e):
+                        raise
+                    self._mark_down(client, e)
+                    last_error = e
+        raise last_error
+
+    def stream(self, prompt, model, **options):
+        """Stream tokens from the least loaded healthy endpoint; fails over only before the first token"""
+        last_error = None
+        tried = set()
+        for _ in self.clients:
+            started = False
+            with self._next_endpoint(tried) as client:
+                try:
+                    for token in client.stream(prompt, model, **options):
+                        started = True
+                        yield token
+                    return
+                except Exception as e:
+                    if started or not _is_failover_error(e):
+                        raise
+                    self._mark_down(client, e)
+                    last_error = e
+        raise last_error
+
+    def check_health(self):
+        """Probe every endpoint and update which ones are in rotation"""
+        for client in self.clients:
+            healthy = client.check_health()
+            with self._lock:
+                if healthy:
+                    self._down_until.pop(client.base_url, None)
+                elif self._is_healthy(client):
+                    logger.warning(f"Ollama endpoint {client.base_url} failed its health check")
+                    self._down_until[client.base_url] = time.time() + self.cooldown
+        return {client.base_url: self._is_healthy(client) for client in self.clients}
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.health_check_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.exception(f"Ollama health check failed: {e}")
+
+    def stats(self):
+        """Return load and health for every endpoint"""
+        with self._lock:
+            return [
+                dict(client.stats(), healthy=self._is_healthy(client), outstanding=self._outstanding[client.base_url])
+                for client in self.clients
+            ]
+
+    def close(self):
+        """Stop health checks and close every client"""
+        self._stopped.set()
+        for client in self.clients:
+            client.close()
+
+
+class PooledOllama(LLM):
+    """LangChain LLM that sends generations through a shared OllamaClient or OllamaRouter"""
+
+    model: str
+    client: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    def _options(self, stop):
+        return {"stop": stop} if stop else {}
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return self.client.generate(prompt, self.model, **self._options(stop))
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        for token in self.client.stream(prompt, self.model, **self._options(stop)):
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Return the process-wide router over the configured Ollama endpoints"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OllamaRouter()
+        return _default_client
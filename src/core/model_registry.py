@@ -0,0 +1,80 @@
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def get_rss_mb():
+    """Return the resident memory of the current process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Peak RSS is the best we can do off Linux (kilobytes on Linux, bytes on macOS)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models keyed by (model_name, device).
+
+    Streamlit keeps imported modules alive between reruns and sessions, so a
+    module-level registry loads each model once per server process.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name, device, loader):
+        """Return the cached model for (model_name, device), calling loader() on first use"""
+        key = (model_name, device)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            # Another thread may have loaded it while we were waiting
+            model = self._models.get(key)
+            if model is not None:
+                return model
+
+            rss_before = get_rss_mb()
+            start = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - start
+            rss_after = get_rss_mb()
+
+            self._models[key] = model
+            self._stats[key] = {
+                "model_name": model_name,
+                "device": device,
+                "load_seconds": load_seconds,
+                "rss_mb": rss_after,
+                "rss_delta_mb": rss_after - rss_before,
+            }
+            logger.info(
+                f"Loaded model {model_name} on {device} in {load_seconds:.2f}s "
+                f"(RSS {rss_after:.0f} MB, +{rss_after - rss_before:.0f} MB)"
+            )
+        return model
+
+    def stats(self):
+        """Return load statistics for every model loaded so far"""
+        with self._lock:
+            return [dict(s) for s in self._stats.values()]
+
+    def clear(self):
+        """Drop all cached models so the next get() reloads them"""
+        with self._lock:
+            self._models.clear()
+            self._stats.clear()
+
+
+model_registry = ModelRegistry()
@@ -1,3 +1,4 @@
+import logging
 import warnings
 import os
 
@@ -10,101 +11,184 @@ warnings.filterwarnings("ignore", message=".*Failed to send telemetry event.*")
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 os.environ["CHROMA_TELEMETRY_ENABLED"] = "False"
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_community.llms import Ollama
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from core.model_registry import model_registry
+from core.vector_store_pool import vector_store_pool
+from core.ingestion import IngestionEngine
+from core.embedding_cache import CachedEmbeddings, QueryCachedEmbeddings, get_embedding_cache
+from core.llm_client import PooledOllama, get_llm_client
+from core.summarizer import HierarchicalSummarizer, get_book_chunks
+from core.lexical_index import LexicalIndex
+from core.retrieval import HybridRetriever
+from core.vector_backends import open_vector_store
+from core.config import EMBED_BATCH_SIZE, EMBED_ENCODE_BATCH_SIZE, OLLAMA_MODEL, VECTOR_BACKEND, VECTOR_QUANTIZATION
 import os
 
-# Chunk and embed text, store in Chroma
+logger = logging.getLogger(__name__)
 
-def chunk_and_embed(pages, persist_directory="./chroma_db", collection_name="default_book"):
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DEVICE = "cpu"
+
+
+def get_embeddings(model_name=EMBEDDING_MODEL_NAME, device=EMBEDDING_DEVICE):
     """
-    pages: list of (page_num, text)
-    Returns: Chroma vector store
+    Return the shared embedding model for (model_name, device).
+    The model is loaded on first use and reused for the lifetime of the process;
+    query embeddings go through the in-process query_embedding_cache.
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
+    return model_registry.get(
+        model_name,
+        device,
+        lambda: QueryCachedEmbeddings(
+            HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={'device': device},
+                encode_kwargs={'batch_size': EMBED_ENCODE_BATCH_SIZE}
+            ),
+            model_name
+        )
     )
-    texts = []
-    metadatas = []
-    for page_num, text in pages:
-        chunks = text_splitter.split_text(text)
-        for chunk in chunks:
-            texts.append(chunk)
-            metadatas.append({"page": page_num})
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'}
+
+# Chunk and embed text, store in the configured vector backend
+
+def chunk_and_embed(pages, persist_directory="./chroma_db", collection_name="default_book",
+                    progress_callback=None, batch_size=EMBED_BATCH_SIZE, total_pages=None,
+                    return_stats=False, backend=VECTOR_BACKEND, quantization=VECTOR_QUANTIZATION):
+    """
+    pages: iterable of (page_num, text); a generator is consumed lazily so
+        splitting and embedding overlap with extraction
+    progress_callback: optional callable receiving IngestionStats after each batch
+    total_pages: page count used for progress reporting when pages is a generator
+    backend: vector backend the new collection is written with ("chroma" or "numpy")
+    quantization: first-pass search codes for a numpy collection ("none", "int8" or "binary")
+    Returns: vector store, or (vector store, IngestionStats) with return_stats=True
+    """
+    embeddings = get_embeddings()
+    vector_store = open_vector_store(
+        persist_directory, collection_name, embeddings, backend=backend, quantization=quantization
     )
-    vector_store = Chroma.from_texts(
-        texts=texts,
-        embedding=embeddings,
-        metadatas=metadatas,
-        persist_directory=persist_directory,
-        collection_name=collection_name
+    # Unchanged chunks (re-uploads, new editions) skip the encoder
+    embedding_cache = get_embedding_cache()
+    encoder = CachedEmbeddings(embeddings, EMBEDDING_MODEL_NAME, embedding_cache) if embedding_cache else embeddings
+    engine = IngestionEngine(encoder, batch_size=batch_size)
+    stats = engine.run(
+        pages, vector_store, progress_callback=progress_callback, total_pages=total_pages,
+        lexical_index=LexicalIndex(persist_directory, collection_name)
     )
+    if embedding_cache:
+        logger.info(f"Embedding cache: {encoder.hits} hits, {encoder.misses} misses for {collection_name}")
+    vector_store_pool.put(persist_directory, collection_name, vector_store)
+    if return_stats:
+        return vector_store, stats
     return vector_store
 
 def load_existing_vector_store(persist_directory="./chroma_db", collection_name="default_book"):
     """
-    Load an existing vector store collection
-    Returns: Chroma vector store or None if collection doesn't exist
+    Load an existing vector store collection with the backend it was written with
+    Returns: vector store or None if collection doesn't exist
     """
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
-        )
-        vector_store = Chroma(
-            persist_directory=persist_directory,
-            collection_name=collection_name,
-            embedding_function=embeddings
-        )
+        embeddings = get_embeddings()
+        vector_store = open_vector_store(persist_directory, collection_name, embeddings)
         return vector_store
     except Exception as e:
-        print(f"Error loading vector store: {e}")
+        logger.exception(f"Error loading vector store {collection_name}: {e}")
         return None
 
 
-def get_ollama_llm(model_name="llama2"):
-    return Ollama(model=model_name)
+def get_vector_store(persist_directory="./chroma_db", collection_name="default_book"):
+    """
+    Return a pooled handle for an existing collection, opening it on first use
+    Returns: vector store or None if collection can't be loaded
+    """
+    return vector_store_pool.get(
+        persist_directory,
+        collection_name,
+        lambda: load_existing_vector_store(persist_directory=persist_directory, collection_name=collection_name)
+    )
+
+
+def get_chunk_count(vector_store):
+    """
+    Return the number of chunks stored in the collection without embedding a query
+    Returns: chunk count, or 0 if the collection can't be read
+    """
+    try:
+        return vector_store.count_chunks()
+    except Exception as e:
+        logger.warning(f"Error counting vector store chunks: {e}")
+        return 0
 
 
-def get_qa_chain(vector_store, llm):
-    prompt_template = """You are a helpful assistant that answers questions about a book based on the provided context.\n\nContext: {context}\n\nQuestion: {question}\n\nPlease provide a comprehensive answer based only on the information in the context. If the context doesn't contain enough information to answer the question, say so.\n\nAnswer:"""
-    prompt = PromptTemplate(
-        template=prompt_template,
+LLM_MODEL_NAME = OLLAMA_MODEL
+
+# Bump whenever the QA prompt or retrieval changes so cached answers from the old one are not reused
+QA_PROMPT_VERSION = 2
+
+
+def get_ollama_llm(model_name=LLM_MODEL_NAME):
+    """Return an LLM whose generations share the process-wide Ollama client"""
+    return PooledOllama(model=model_name, client=get_llm_client())
+
+
+QA_PROMPT_TEMPLATE = """You are a helpful assistant that answers questions about a book based on the provided context.\n\nContext: {context}\n\nQuestion: {question}\n\nPlease provide a comprehensive answer based only on the information in the context. If the context doesn't contain enough information to answer the question, say so.\n\nAnswer:"""
+QA_RETRIEVAL_K = 4
+
+
+def get_qa_prompt():
+    return PromptTemplate(
+        template=QA_PROMPT_TEMPLATE,
         input_variables=["context", "question"]
     )
+
+
+def get_retriever(vector_store, k=QA_RETRIEVAL_K):
+    """
+    Hybrid retriever fusing vector and BM25 keyword results for a collection.
+    Collections ingested before keyword indexing get their index built on first use.
+    """
+    lexical_index = LexicalIndex(vector_store.persist_directory or ".", vector_store.collection_name)
+    if not lexical_index.exists() and get_chunk_count(vector_store) > 0:
+        lexical_index.rebuild_from(vector_store)
+    return HybridRetriever(vector_store=vector_store, lexical_index=lexical_index, k=k)
+
+
+def get_qa_chain(vector_store, llm):
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=vector_store.as_retriever(search_kwargs={"k": 5}),
-        chain_type_kwargs={"prompt": prompt},
+        retriever=get_retriever(vector_store),
+        chain_type_kwargs={"prompt": get_qa_prompt()},
         return_source_documents=True
     )
     return qa_chain
 
 
-def get_summary_chain(vector_store, llm):
-    summary_prompt = """Based on the following context from a book, provide a comprehensive summary including:\n\n1. Main themes and topics\n2. Key concepts and ideas\n3. Important characters or subjects (if applicable)\n4. Overall structure and organization\n\nContext: {context}\n\nPlease provide a detailed summary:"""
-    prompt = PromptTemplate(
-        template=summary_prompt,
-        input_variables=["context"]
-    )
+def stream_qa_answer(vector_store, llm, question):
+    """
+    Retrieve context for a question and stream the answer from the LLM.
+    Returns (source_documents, tokens) where tokens yields text as the LLM generates it.
+    Uses the same prompt and retrieval as get_qa_chain.
+    """
+    source_documents = get_retriever(vector_store).invoke(question)
+    # Same separator the "stuff" chain uses between documents
+    context = "\n\n".join(doc.page_content for doc in source_documents)
+    prompt_text = get_qa_prompt().format(context=context, question=question)
+    return source_documents, llm.stream(prompt_text)
+
+
+def get_summary_chain(vector_store, llm, db_path="books.db"):
+    """
+    Return a callable that summarizes the whole book map-reduce style.
+    Intermediate summaries are cached per collection in db_path, so
+    regenerating only re-runs the parts whose input changed.
+    """
+    summarizer = HierarchicalSummarizer(llm, db_path=db_path)
     
-    # Create a simple chain for summary generation
-    summary_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=vector_store.as_retriever(search_kwargs={"k": 20}),
-        chain_type_kwargs={"prompt": prompt},
-        return_source_documents=False
-    )
+    def summarize():
+        chunks = get_book_chunks(vector_store)
+        return {"result": summarizer.summarize(vector_store.collection_name, chunks)}
     
-    return lambda: summary_chain.invoke({"query": "Generate a comprehensive summary of this book"}) 
\ No newline at end of file
+    return summarize 
\ No newline at end of file
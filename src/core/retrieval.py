@@ -0,0 +1,46 @@
+import logging
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from core.config import HYBRID_FETCH_K, RRF_K
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """
+    Merge ranked lists of Documents by reciprocal rank fusion.
+    A document scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+    Returns the top k documents, best first.
+    """
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses dense (Chroma) and lexical (FTS5 BM25) results for a question"""
+
+    vector_store: Any
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = HYBRID_FETCH_K
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        lexical = [
+            Document(page_content=content, metadata={"page": page}, id=chunk_id)
+            for chunk_id, content, page in self.lexical_index.search(query, self.fetch_k)
+        ]
+        dense = self.vector_store.similarity_search(query, k=self.fetch_k)
+        return reciprocal_rank_fusion([dense, lexical], self.k)
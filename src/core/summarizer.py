@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import SUMMARY_GROUP_CHARS, SUMMARY_REDUCE_FANOUT, SUMMARY_MAX_CONCURRENCY
+from core.connection_pool import transaction
+from core.database import BookDatabase
+
+logger = logging.getLogger(__name__)
+
+MAP_PROMPT = """Summarize the following passage from a book. Keep the key events, ideas, characters and terms it introduces.\n\nPassage:\n{text}\n\nSummary:"""
+
+REDUCE_PROMPT = """The following are summaries of consecutive parts of a book, in order. Combine them into a single summary that keeps the key events, ideas, characters and terms.\n\nSummaries:\n{text}\n\nCombined summary:"""
+
+FINAL_PROMPT = """Based on the following summaries of consecutive parts of a book, provide a comprehensive summary including:\n\n1. Main themes and topics\n2. Key concepts and ideas\n3. Important characters or subjects (if applicable)\n4. Overall structure and organization\n\nContext: {text}\n\nPlease provide a detailed summary:"""
+
+# SQLite's default limit on bound parameters is 999
+_SQL_BATCH = 500
+
+
+def get_book_chunks(vector_store):
+    """Return every chunk of a collection's text in book order"""
+    ids, documents, metadatas = vector_store.get_chunks()
+
+    def order(item):
+        chunk_id, _, metadata = item
+        match = re.fullmatch(r"chunk_(\d+)", chunk_id)
+        return (metadata or {}).get("page", 0), int(match.group(1)) if match else 0
+
+    items = sorted(zip(ids, documents, metadatas), key=order)
+    return [document for _, document, _ in items if document]
+
+
+def group_chunks(chunks, max_chars):
+    """Split chunks into consecutive groups of at most max_chars (a longer chunk gets its own group)"""
+    groups = []
+    current = []
+    current_chars = 0
+    for chunk in chunks:
+        if current and current_chars + len(chunk) > max_chars:
+            groups.append(current)
+            current = []
+            current_chars = 0
+        current.append(chunk)
+        current_chars += len(chunk)
+    if current:
+        groups.append(current)
+    return groups
+
+
+class HierarchicalSummarizer:
+    """
+    Map-reduce summarizer over a whole book.
+    Groups of chunks are summarized in parallel, then the summaries are merged
+    fanout at a time, level by level, until one final summary remains. Every
+    node is cached in summary_nodes keyed by a hash of its prompt and model, so
+    regenerating only re-runs nodes whose input changed.
+    """
+
+    def __init__(self, llm, db_path="books.db", group_chars=SUMMARY_GROUP_CHARS,
+                 fanout=SUMMARY_REDUCE_FANOUT, max_concurrency=SUMMARY_MAX_CONCURRENCY):
+        # Makes sure the summary_nodes table has been migrated in
+        BookDatabase(db_path)
+        self.llm = llm
+        self.model_name = getattr(llm, "model", type(llm).__name__)
+        self.db_path = db_path
+        self.group_chars = group_chars
+        self.fanout = max(2, fanout)
+        self.max_concurrency = max(1, max_concurrency)
+        self.generated = 0
+        self.reused = 0
+
+    def summarize(self, collection_name, chunks):
+        """Return a summary covering every chunk, reusing cached nodes where possible"""
+        if not chunks:
+            return ""
+
+        started = time.time()
+        texts = ["\n".join(group) for group in group_chunks(chunks, self.group_chars)]
+        nodes = self._run_level(collection_name, 0, MAP_PROMPT, texts, started)
+
+        level = 0
+        while len(nodes) > self.fanout:
+            level += 1
+            groups = [nodes[i:i + self.fanout] for i in range(0, len(nodes), self.fanout)]
+            nodes = self._run_level(collection_name, level, REDUCE_PROMPT, ["\n\n".join(g) for g in groups], started)
+
+        summary = self._run_level(collection_name, level + 1, FINAL_PROMPT, ["\n\n".join(nodes)], started)[0]
+
+        # Nodes not used by this run belong to an older version of the tree
+        with transaction(self.db_path) as cursor:
+            cursor.execute('''
+                DELETE FROM summary_nodes WHERE collection_name = ? AND last_used < ?
+            ''', (collection_name, started))
+
+        logger.info(
+            f"Summarized {collection_name}: {len(texts)} sections, {level + 2} levels, "
+            f"{self.generated} generated, {self.reused} reused"
+        )
+        return summary
+
+    def _hash(self, prompt):
+        return hashlib.sha256(f"{self.model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _generate(self, prompt):
+        result = self.llm.invoke(prompt)
+        return str(getattr(result, "content", result)).strip()
+
+    def _run_level(self, collection_name, level, template, inputs, now):
+        """Summarize each input with template, in parallel, skipping cached nodes"""
+        prompts = [template.format(text=text) for text in inputs]
+        hashes = [self._hash(prompt) for prompt in prompts]
+        summaries = self._load_nodes(collection_name, hashes, now)
+
+        missing = [i for i, input_hash in enumerate(hashes) if input_hash not in summaries]
+        self.reused += len(hashes) - len(missing)
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(missing))) as executor:
+                generated = list(executor.map(self._generate, [prompts[i] for i in missing]))
+            self.generated += len(missing)
+
+            rows = [(collection_name, hashes[i], level, summary, now, now) for i, summary in zip(missing, generated)]
+            with transaction(self.db_path) as cursor:
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO summary_nodes
+                        (collection_name, input_hash, level, summary, created_at, last_used)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+            for i, summary in zip(missing, generated):
+                summaries[hashes[i]] = summary
+
+        return [summaries[input_hash] for input_hash in hashes]
+
+    def _load_nodes(self, collection_name, hashes, now):
+        """Return {input_hash: summary} for cached nodes and mark them as used"""
+        found = {}
+        with transaction(self.db_path) as cursor:
+            for start in range(0, len(hashes), _SQL_BATCH):
+                batch = hashes[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f'''
+                    SELECT input_hash, summary FROM summary_nodes
+                    WHERE collection_name = ? AND input_hash IN ({placeholders})
+                ''', [collection_name] + batch)
+                found.update(cursor.fetchall())
+                cursor.execute(f'''
+                    UPDATE summary_nodes SET last_used = ?
+                    WHERE collection_name = ? AND input_hash IN ({placeholders})
+                ''', [now, collection_name] + batch)
+        return found
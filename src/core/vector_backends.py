@@ -0,0 +1,457 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from core.config import VECTOR_INDEX_DTYPE, VECTOR_QUANTIZATION, QUANTIZED_RESCORE_FACTOR
+
+# Rows scored per matrix product, bounding the float32 temporaries for float16 indexes
+_SEARCH_BLOCK_ROWS = 16384
+
+_VECTORS_FILE = "vectors.npy"
+_NORMS_FILE = "norms.npy"
+_OFFSETS_FILE = "offsets.npy"
+_DOCUMENTS_FILE = "documents.bin"
+_METADATA_FILE = "metadata.json"
+_CODES_FILE = "codes.npy"
+_SCALES_FILE = "scales.npy"
+_CENTER_FILE = "center.npy"
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# Set bits in every byte value, for numpy releases without np.bitwise_count (< 2.0)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(codes, query_bits):
+    """Hamming distance from packed query_bits to every row of packed codes"""
+    differing = np.bitwise_xor(codes, query_bits)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(differing).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[differing].sum(axis=1, dtype=np.int32)
+
+
+def quantize_int8(vectors):
+    """Per-row symmetric int8 codes, and the scales mapping them back to floats"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def binarize(vectors, center):
+    """Signs of vectors - center packed 8 per byte; centering balances the bits of anisotropic embeddings"""
+    return np.packbits(np.asarray(vectors) > center, axis=-1)
+
+
+class ChromaStore(Chroma):
+    """Chroma collection with the chunk-level interface every vector backend provides"""
+
+    backend_name = "chroma"
+
+    @property
+    def collection_name(self):
+        return self._collection.name
+
+    @property
+    def persist_directory(self):
+        return self._persist_directory
+
+    def upsert_chunks(self, ids, embeddings, documents, metadatas):
+        """Insert or replace chunks with precomputed embeddings"""
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def flush(self):
+        """Chroma persists every write itself"""
+
+    def count_chunks(self):
+        return self._collection.count()
+
+    def get_chunks(self):
+        """Return (ids, documents, metadatas) for every chunk"""
+        result = self._collection.get(include=["documents", "metadatas"])
+        return result["ids"], result["documents"], result["metadatas"]
+
+
+def numpy_store_path(persist_directory, collection_name):
+    """Directory holding a collection's NumpyFlatStore files"""
+    return os.path.join(persist_directory, "numpy", collection_name)
+
+
+def _write_rows(path, ids, vectors, documents, metadatas):
+    """Write rows as a vectors/offsets/documents/metadata file set in a new directory"""
+    encoded = [document.encode("utf-8") for document in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(document) for document in encoded])
+    os.makedirs(path)
+    np.save(os.path.join(path, _VECTORS_FILE), vectors)
+    np.save(os.path.join(path, _OFFSETS_FILE), offsets)
+    with open(os.path.join(path, _DOCUMENTS_FILE), "wb") as f:
+        f.write(b"".join(encoded))
+    with open(os.path.join(path, _METADATA_FILE), "w") as f:
+        json.dump({"ids": list(ids), "metadatas": [metadata or {} for metadata in metadatas]}, f)
+
+
+def _map_rows(path):
+    """Memory-map the (vectors, offsets, documents) of a file set written by _write_rows or flush"""
+    vectors = np.load(os.path.join(path, _VECTORS_FILE), mmap_mode="r")
+    offsets = np.load(os.path.join(path, _OFFSETS_FILE), mmap_mode="r")
+    documents_path = os.path.join(path, _DOCUMENTS_FILE)
+    # np.memmap refuses empty files
+    if os.path.getsize(documents_path):
+        documents = np.memmap(documents_path, dtype=np.uint8, mode="r")
+    else:
+        documents = np.zeros(0, dtype=np.uint8)
+    return vectors, offsets, documents
+
+
+class NumpyFlatStore(VectorStore):
+    """
+    Exact (flat) vector index for one collection, stored as plain files:
+    a float32 or float16 matrix in a .npy file, squared row norms, chunk texts
+    in one UTF-8 blob with row offsets, and ids and metadata as JSON.
+    Opening a store maps the files read-only, so it costs next to nothing and
+    processes searching the same book share the OS page cache. Searches score
+    every row with one matrix product and return squared L2 distances, the
+    same scale Chroma reports.
+    upsert_chunks writes each batch to a staged shard on disk, so ingesting
+    a book holds one batch in memory and a crashed ingest keeps what it wrote.
+    flush merges the staged shards into the index block by block and swaps in
+    the new directory at once; until then, staged chunks are not searchable.
+    With quantization "int8" or "binary" the first pass scans compact codes
+    instead (4x or 32x fewer bytes than float32) and only the closest
+    k * rescore_factor candidates are scored exactly against the float rows,
+    which stay on disk and are paged in on demand.
+    """
+
+    backend_name = "numpy"
+
+    def __init__(self, persist_directory, collection_name, embedding_function=None, dtype=VECTOR_INDEX_DTYPE,
+                 quantization=VECTOR_QUANTIZATION, rescore_factor=QUANTIZED_RESCORE_FACTOR):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization: {quantization}")
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.path = numpy_store_path(persist_directory, collection_name)
+        self.dtype = np.dtype(dtype)
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._embedding_function = embedding_function
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def exists(cls, persist_directory, collection_name):
+        return os.path.exists(os.path.join(numpy_store_path(persist_directory, collection_name), _METADATA_FILE))
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def _load(self):
+        """Map the files on first use"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if os.path.exists(os.path.join(self.path, _METADATA_FILE)):
+                with open(os.path.join(self.path, _METADATA_FILE)) as f:
+                    metadata = json.load(f)
+                self._ids = metadata["ids"]
+                self._metadatas = metadata["metadatas"]
+                # A collection keeps the format it was written with
+                self.dtype = np.dtype(metadata.get("dtype", self.dtype.name))
+                self.quantization = metadata.get("quantization", "none")
+                self._vectors, self._offsets, self._documents = _map_rows(self.path)
+                self._sq_norms = np.load(os.path.join(self.path, _NORMS_FILE), mmap_mode="r")
+                if self.quantization != "none":
+                    self._codes = np.load(os.path.join(self.path, _CODES_FILE), mmap_mode="r")
+                if self.quantization == "int8":
+                    self._scales = np.load(os.path.join(self.path, _SCALES_FILE), mmap_mode="r")
+                elif self.quantization == "binary":
+                    self._center = np.load(os.path.join(self.path, _CENTER_FILE))
+            else:
+                self._ids = []
+                self._metadatas = []
+                self._vectors = np.zeros((0, 0), dtype=self.dtype)
+                self._sq_norms = np.zeros(0, dtype=np.float32)
+                self._offsets = np.zeros(1, dtype=np.int64)
+                self._documents = np.zeros(0, dtype=np.uint8)
+            self._loaded = True
+
+    def _document(self, row):
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return bytes(self._documents[start:end]).decode("utf-8")
+
+    @property
+    def staging_path(self):
+        """Directory of batches written by upsert_chunks and not yet merged by flush"""
+        return f"{self.path}.staging"
+
+    def _staged_shards(self):
+        if not os.path.isdir(self.staging_path):
+            return []
+        return sorted(
+            os.path.join(self.staging_path, name) for name in os.listdir(self.staging_path) if not name.endswith(".tmp")
+        )
+
+    def upsert_chunks(self, ids, embeddings, documents, metadatas):
+        """Write chunks with precomputed embeddings to a staged shard; flush merges them into the index"""
+        with self._lock:
+            os.makedirs(self.staging_path, exist_ok=True)
+            shard_path = os.path.join(self.staging_path, f"{len(self._staged_shards()):06d}")
+            # Shards appear under their final name only once complete
+            tmp_path = f"{shard_path}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            _write_rows(tmp_path, ids, np.asarray(embeddings, dtype=np.float32), documents, metadatas)
+            os.rename(tmp_path, shard_path)
+
+    def flush(self):
+        """Merge staged shards into the files, later chunks replacing earlier ones with the same ID"""
+        shards = self._staged_shards()
+        if not shards:
+            return
+        self._load()
+        with self._lock:
+            ids = list(self._ids)
+            metadatas = list(self._metadatas)
+            rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+            # (shard index, row in shard) for every row taken from a shard
+            replaced = {}
+            sources = []
+            for shard_index, shard_path in enumerate(shards):
+                with open(os.path.join(shard_path, _METADATA_FILE)) as f:
+                    shard = json.load(f)
+                sources.append(_map_rows(shard_path))
+                for shard_row, (chunk_id, metadata) in enumerate(zip(shard["ids"], shard["metadatas"])):
+                    row = rows.get(chunk_id)
+                    if row is None:
+                        row = rows[chunk_id] = len(ids)
+                        ids.append(chunk_id)
+                        metadatas.append(metadata)
+                    else:
+                        metadatas[row] = metadata
+                    replaced[row] = (shard_index, shard_row)
+            self._write(ids, metadatas, replaced, sources)
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+            self._loaded = False
+
+    def _write(self, ids, metadatas, replaced, sources):
+        """
+        Write the merged index to a new directory and swap it in.
+        Rows listed in replaced come from the staged shards in sources, the rest
+        from the current files; everything is copied in blocks.
+        """
+        tmp_path = f"{self.path}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(tmp_path)
+        dim = sources[0][0].shape[1]
+        vectors = np.lib.format.open_memmap(
+            os.path.join(tmp_path, _VECTORS_FILE), mode="w+", dtype=self.dtype, shape=(len(ids), dim)
+        )
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+
+        kept = len(self._ids)
+        for start in range(0, kept, _SEARCH_BLOCK_ROWS):
+            vectors[start:start + _SEARCH_BLOCK_ROWS] = self._vectors[start:start + _SEARCH_BLOCK_ROWS]
+        for shard_index, (shard_vectors, _, _) in enumerate(sources):
+            targets = [row for row, (index, _) in replaced.items() if index == shard_index]
+            vectors[targets] = shard_vectors[[replaced[row][1] for row in targets]]
+
+        with open(os.path.join(tmp_path, _DOCUMENTS_FILE), "wb") as f:
+            for row in range(len(ids)):
+                if row in replaced:
+                    shard_index, source_row = replaced[row]
+                    _, source_offsets, source_documents = sources[shard_index]
+                else:
+                    source_row, source_offsets, source_documents = row, self._offsets, self._documents
+                document = source_documents[int(source_offsets[source_row]):int(source_offsets[source_row + 1])]
+                f.write(bytes(document))
+                offsets[row + 1] = offsets[row] + len(document)
+        np.save(os.path.join(tmp_path, _OFFSETS_FILE), offsets)
+
+        # Norms of the stored (possibly float16) rows keep distances exact for what is searched
+        sq_norms = np.empty(len(ids), dtype=np.float32)
+        total = np.zeros(dim, dtype=np.float64)
+        for start in range(0, len(ids), _SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + _SEARCH_BLOCK_ROWS], dtype=np.float32)
+            sq_norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+            total += block.sum(axis=0)
+        np.save(os.path.join(tmp_path, _NORMS_FILE), sq_norms)
+
+        if self.quantization == "int8":
+            codes = np.lib.format.open_memmap(
+                os.path.join(tmp_path, _CODES_FILE), mode="w+", dtype=np.int8, shape=(len(ids), dim)
+            )
+            scales = np.empty(len(ids), dtype=np.float32)
+            for start in range(0, len(ids), _SEARCH_BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + _SEARCH_BLOCK_ROWS], dtype=np.float32)
+                codes[start:start + len(block)], scales[start:start + len(block)] = quantize_int8(block)
+            codes.flush()
+            np.save(os.path.join(tmp_path, _SCALES_FILE), scales)
+        elif self.quantization == "binary":
+            center = (total / max(1, len(ids))).astype(np.float32)
+            codes = np.lib.format.open_memmap(
+                os.path.join(tmp_path, _CODES_FILE), mode="w+", dtype=np.uint8, shape=(len(ids), (dim + 7) // 8)
+            )
+            for start in range(0, len(ids), _SEARCH_BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + _SEARCH_BLOCK_ROWS], dtype=np.float32)
+                codes[start:start + len(block)] = binarize(block, center)
+            codes.flush()
+            np.save(os.path.join(tmp_path, _CENTER_FILE), center)
+        vectors.flush()
+        del vectors
+
+        with open(os.path.join(tmp_path, _METADATA_FILE), "w") as f:
+            json.dump(
+                {"ids": ids, "metadatas": metadatas, "dtype": self.dtype.name, "quantization": self.quantization}, f
+            )
+
+        # Readers that already mapped the old files keep them until they reload
+        old_path = f"{self.path}.old-{uuid.uuid4().hex}"
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def count_chunks(self):
+        self._load()
+        return len(self._ids)
+
+    def get_chunks(self):
+        """Return (ids, documents, metadatas) for every chunk"""
+        self._load()
+        return list(self._ids), [self._document(row) for row in range(len(self._ids))], list(self._metadatas)
+
+    def delete_collection(self):
+        with self._lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+            self._loaded = False
+
+    def _distances(self, query, rows=None):
+        """Exact squared L2 distance from query to every row, or to the given rows"""
+        if rows is not None:
+            block = np.asarray(self._vectors[rows], dtype=np.float32)
+            return self._sq_norms[rows] - 2.0 * (block @ query) + query @ query
+        distances = np.empty(len(self._ids), dtype=np.float32)
+        for start in range(0, len(self._ids), _SEARCH_BLOCK_ROWS):
+            block = np.asarray(self._vectors[start:start + _SEARCH_BLOCK_ROWS], dtype=np.float32)
+            distances[start:start + len(block)] = self._sq_norms[start:start + len(block)] - 2.0 * (block @ query)
+        distances += query @ query
+        return distances
+
+    def _candidates(self, query, count):
+        """
+        Rows whose quantized codes are closest to query, in row order,
+        or None when every row should be scored exactly
+        """
+        if self.quantization == "none" or count >= len(self._ids):
+            return None
+        approx = np.empty(len(self._ids), dtype=np.float32)
+        if self.quantization == "binary":
+            query_bits = binarize(query, self._center)
+        for start in range(0, len(self._ids), _SEARCH_BLOCK_ROWS):
+            end = min(start + _SEARCH_BLOCK_ROWS, len(self._ids))
+            if self.quantization == "int8":
+                block = np.asarray(self._codes[start:end], dtype=np.float32)
+                approx[start:end] = self._sq_norms[start:end] - 2.0 * self._scales[start:end] * (block @ query)
+            else:
+                approx[start:end] = hamming_distances(self._codes[start:end], query_bits)
+        # Sorted rows read the float vectors front to back
+        return np.sort(np.argpartition(approx, count - 1)[:count])
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Return the k closest chunks with their squared L2 distance, closest first"""
+        self._load()
+        if not self._ids or k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        k = min(k, len(self._ids))
+        rows = self._candidates(query, k * self.rescore_factor)
+        if rows is None:
+            rows = np.arange(len(self._ids))
+            distances = self._distances(query)
+        else:
+            distances = self._distances(query, rows)
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [
+            (
+                Document(
+                    page_content=self._document(rows[i]), metadata=dict(self._metadatas[rows[i]]), id=self._ids[rows[i]]
+                ),
+                float(distances[i]),
+            )
+            for i in top
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(self._embedding_function.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def add_texts(
+        self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None, **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.upsert_chunks(ids, self._embedding_function.embed_documents(texts), texts, metadatas)
+        self.flush()
+        return ids
+
+    @classmethod
+    def from_texts(
+        cls, texts: List[str], embedding: Any, metadatas: Optional[List[dict]] = None,
+        persist_directory: str = "./chroma_db", collection_name: str = "default_book", **kwargs: Any
+    ) -> "NumpyFlatStore":
+        store = cls(persist_directory, collection_name, embedding_function=embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        return store
+
+
+def detect_vector_backend(persist_directory, collection_name):
+    """Backend holding an existing collection; collections without NumPy files live in Chroma"""
+    if NumpyFlatStore.exists(persist_directory, collection_name):
+        return NumpyFlatStore.backend_name
+    return ChromaStore.backend_name
+
+
+def open_vector_store(persist_directory, collection_name, embeddings, backend=None, quantization="none"):
+    """
+    Open a collection with the named backend ("chroma" or "numpy").
+    backend=None uses the backend the collection was written with.
+    quantization applies to numpy collections written by this handle; existing
+    ones keep the quantization they were written with.
+    """
+    if backend is None:
+        backend = detect_vector_backend(persist_directory, collection_name)
+    if backend == "chroma":
+        if quantization != "none":
+            raise ValueError("Quantized embeddings need the numpy vector backend (set VECTOR_BACKEND=numpy)")
+        return ChromaStore(
+            persist_directory=persist_directory,
+            collection_name=collection_name,
+            embedding_function=embeddings
+        )
+    if backend == "numpy":
+        return NumpyFlatStore(persist_directory, collection_name, embedding_function=embeddings, quantization=quantization)
+    raise ValueError(f"Unknown vector backend: {backend}")
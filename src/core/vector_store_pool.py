@@ -0,0 +1,71 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from core.config import VECTOR_STORE_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStorePool:
+    """Bounded LRU pool of open vector store handles keyed by (persist_directory, collection_name)"""
+
+    def __init__(self, max_size=VECTOR_STORE_POOL_SIZE):
+        self.max_size = max(1, max_size)
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(persist_directory, collection_name):
+        return (os.path.abspath(persist_directory), collection_name)
+
+    def get(self, persist_directory, collection_name, loader):
+        """
+        Return the pooled handle for the collection, calling loader() on a miss.
+        A loader result of None is passed through and not cached.
+        """
+        key = self._key(persist_directory, collection_name)
+        with self._lock:
+            if key in self._handles:
+                self._handles.move_to_end(key)
+                return self._handles[key]
+
+        vector_store = loader()
+        if vector_store is not None:
+            self.put(persist_directory, collection_name, vector_store)
+        return vector_store
+
+    def put(self, persist_directory, collection_name, vector_store):
+        """Add or replace a handle, evicting the least recently used one if the pool is full"""
+        key = self._key(persist_directory, collection_name)
+        with self._lock:
+            self._handles[key] = vector_store
+            self._handles.move_to_end(key)
+            while len(self._handles) > self.max_size:
+                evicted_key, _ = self._handles.popitem(last=False)
+                logger.info(f"Evicted vector store handle: {evicted_key[1]}")
+
+    def invalidate(self, collection_name, persist_directory=None):
+        """Drop the handles for a collection, in every persist directory unless one is given"""
+        with self._lock:
+            if persist_directory is not None:
+                self._handles.pop(self._key(persist_directory, collection_name), None)
+                return
+            for key in [k for k in self._handles if k[1] == collection_name]:
+                del self._handles[key]
+
+    def clear(self):
+        """Drop every pooled handle"""
+        with self._lock:
+            self._handles.clear()
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, key):
+        persist_directory, collection_name = key
+        return self._key(persist_directory, collection_name) in self._handles
+
+
+vector_store_pool = VectorStorePool()
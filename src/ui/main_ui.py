@@ -6,9 +6,14 @@ import json
 from core.database import BookDatabase
 import tempfile
 import uuid
+import hashlib
 from pathlib import Path
-from utils.pdf_utils import extract_text_from_pdf
-from core.rag_chain import chunk_and_embed, get_ollama_llm, get_summary_chain, load_existing_vector_store
+from core.rag_chain import get_vector_store, get_chunk_count
+from core.model_registry import model_registry, get_rss_mb
+from core.llm_client import get_llm_client
+from core.embedding_cache import query_embedding_cache
+from core.library_search import search_library
+from core.jobs import get_job_queue, INGEST_JOB, SUMMARY_JOB, INGEST_PRIORITY
 import logging
 logger = logging.getLogger(__name__)
 
@@ -61,6 +66,7 @@ def render_navigation():
         pages = {
             "🏠 Home": "home",
             "📚 Library": "library", 
+            "🔎 Search": "search",
             "📤 Upload": "upload",
             "📊 Analytics": "analytics",
             "⚙️ Settings": "settings"
@@ -103,10 +109,9 @@ def render_home_page():
     
     # Recent activity
     st.subheader("📈 Recent Activity")
-    books = st.session_state.db.get_all_books()
+    recent_books = st.session_state.db.search_books(sort_by="Recent", limit=3)
     
-    if books:
-        recent_books = books[:3]
+    if recent_books:
         cols = st.columns(len(recent_books))
         
         for i, book in enumerate(recent_books):
@@ -154,11 +159,8 @@ def render_upload_page():
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🚀 Process Files", type="primary"):
-                with st.spinner("Processing files..."):
-                    process_uploaded_files(uploaded_files)
-                    st.success("✅ Files processed successfully!")
-                    st.session_state.current_page = "library"
-                    st.rerun()
+                process_uploaded_files(uploaded_files)
+    render_job_status()
     st.markdown("---")
     st.subheader("💡 Upload Tips")
     st.markdown("""
@@ -180,10 +182,11 @@ def render_library_page():
     with col2:
         sort_by = st.selectbox("Sort by", ["Recent", "Name", "Size", "Date"])
     
-    # Get books
-    books = st.session_state.db.get_all_books()
+    # Count matches; only the visible page of books is fetched below
+    db = st.session_state.db
+    total_books = db.count_books(search_term)
     
-    if not books:
+    if not total_books and not search_term:
         st.info("""
         📖 **No books uploaded yet!**
         
@@ -194,33 +197,21 @@ def render_library_page():
             st.rerun()
         return
     
-    # Filter books based on search
-    if search_term:
-        books = [book for book in books if search_term.lower() in book[1].lower() or search_term.lower() in book[2].lower()]
-    
-    if not books:
+    if not total_books:
         st.warning("No books match your search criteria.")
         return
     
-    # Sort books
-    if sort_by == "Recent":
-        books = sorted(books, key=lambda x: x[6], reverse=True)  # last_accessed
-    elif sort_by == "Name":
-        books = sorted(books, key=lambda x: x[1])  # title
-    elif sort_by == "Size":
-        books = sorted(books, key=lambda x: x[4] or 0, reverse=True)  # total_chars
-    elif sort_by == "Date":
-        books = sorted(books, key=lambda x: x[5], reverse=True)  # upload_date
-    
     # Display books in grid
-    st.subheader(f"📚 {len(books)} Book(s)")
+    st.subheader(f"📚 {total_books} Book(s)")
     
     # Pagination
     items_per_page = 6
-    total_pages = (len(books) + items_per_page - 1) // items_per_page
+    total_pages = (total_books + items_per_page - 1) // items_per_page
     
     if 'library_page' not in st.session_state:
         st.session_state.library_page = 0
+    # A narrower search can leave the saved page past the end
+    st.session_state.library_page = min(st.session_state.library_page, total_pages - 1)
     
     # Page navigation
     if total_pages > 1:
@@ -236,10 +227,13 @@ def render_library_page():
                 st.session_state.library_page = min(total_pages - 1, st.session_state.library_page + 1)
                 st.rerun()
     
-    # Display books for current page
-    start_idx = st.session_state.library_page * items_per_page
-    end_idx = min(start_idx + items_per_page, len(books))
-    current_books = books[start_idx:end_idx]
+    # Fetch the books for the current page
+    current_books = db.search_books(
+        search_term,
+        sort_by=sort_by,
+        limit=items_per_page,
+        offset=st.session_state.library_page * items_per_page
+    )
     
     # Book grid
     cols = st.columns(3)
@@ -293,6 +287,43 @@ def render_library_page():
         st.markdown("---")
         render_current_book_interface()
 
+def render_search_page():
+    """Render the library-wide search page"""
+    st.header("🔎 Search Library")
+    st.markdown("Find the passages, and the books, that discuss a topic across your whole library.")
+    
+    query = st.text_input(
+        "Search all books",
+        placeholder="e.g. the causes of the French Revolution",
+        key="library_search_query"
+    )
+    if not query.strip():
+        return
+    
+    with st.spinner("Searching your library..."):
+        hits = search_library(st.session_state.db, query)
+    if not hits:
+        st.info("No matching passages found.")
+        return
+    
+    # Group passages by book, books ordered by their best passage
+    books = {}
+    for hit in hits:
+        books.setdefault(hit["book_id"], []).append(hit)
+    st.caption(f"{len(hits)} passage(s) from {len(books)} book(s)")
+    
+    for book_id, book_hits in books.items():
+        st.subheader(f"📖 {book_hits[0]['title']}")
+        for hit in book_hits:
+            snippet = hit["content"] if len(hit["content"]) <= 300 else hit["content"][:300] + "..."
+            st.markdown(f"**Page {hit['page'] or 'N/A'}**")
+            st.caption(snippet)
+        if st.button("📖 Open", key=f"search_open_{book_id}"):
+            st.session_state.current_book_id = book_id
+            st.session_state.db.update_last_accessed(book_id)
+            st.session_state.current_page = "library"
+            st.rerun()
+
 def render_current_book_interface():
     """Render the current book interface"""
     book_info = st.session_state.db.get_book_by_id(st.session_state.current_book_id)
@@ -312,7 +343,7 @@ def render_current_book_interface():
     with col3:
         st.metric("Upload Date", str(book_info[7]))
     with col4:
-        history_count = len(st.session_state.db.get_chat_history(st.session_state.current_book_id))
+        history_count = st.session_state.db.count_chat_history(st.session_state.current_book_id)
         st.metric("Conversations", history_count)
     
     # Book actions
@@ -348,8 +379,10 @@ def render_chat_tab():
         with st.chat_message("user"):
             st.write(st.session_state.pending_question)
         with st.chat_message("assistant"):
-            with st.spinner("🤔 Thinking..."):
-                st.write("Processing your question...")
+            # handle_chat_interaction streams the answer into this placeholder
+            placeholder = st.empty()
+            placeholder.write("🤔 Thinking...")
+            st.session_state.chat_answer_placeholder = placeholder
     
     # Display chat history
     st.markdown("<div style='margin-bottom: 1rem;'></div>", unsafe_allow_html=True)
@@ -370,42 +403,27 @@ def render_chat_tab():
     st.markdown("<div style='margin-bottom: 1rem;'></div>", unsafe_allow_html=True)
 
 def generate_summary_for_book(book_id):
-    """Generate summary for a specific book"""
+    """Queue a background summary for a specific book"""
     try:
         book_info = st.session_state.db.get_book_by_id(book_id)
         if not book_info:
             return False, "Book not found"
         
         collection_name = book_info[4]
-        vector_store = load_existing_vector_store(persist_directory="./chroma_db", collection_name=collection_name)
+        vector_store = get_vector_store(persist_directory="./chroma_db", collection_name=collection_name)
         
         if not vector_store:
             return False, "Could not load vector store"
         
-        # Test if vector store has content
-        test_docs = vector_store.similarity_search("test", k=1)
-        if not test_docs:
+        # Check the vector store has content
+        if get_chunk_count(vector_store) == 0:
             return False, "Vector store is empty"
         
-        llm = get_ollama_llm()
-        summary_chain = get_summary_chain(vector_store, llm)
-        
-        with st.spinner("Generating summary..."):
-            summary_result = summary_chain()
-            # Extract the result string from the dictionary
-            if isinstance(summary_result, dict) and 'result' in summary_result:
-                summary = summary_result['result']
-            else:
-                summary = str(summary_result)
-        
-        if summary:
-            st.session_state.db.add_summary(book_id, summary)
-            return True, summary
-        else:
-            return False, "No summary generated"
+        job_id = get_job_queue().submit_summary(book_id)
+        return True, job_id
             
     except Exception as e:
-        logger.exception(f"Error generating summary for book {book_id}: {e}")
+        logger.exception(f"Error queuing summary for book {book_id}: {e}")
         return False, str(e)
 
 def render_summary_tab():
@@ -437,14 +455,21 @@ def render_summary_tab():
             mime="text/plain"
         )
     else:
-        st.info("No summary available yet.")
+        summary_status = st.session_state.db.get_summary_status(st.session_state.current_book_id)
+        if summary_status in ("pending", "running"):
+            st.info("⏳ The summary is being generated in the background. Check back in a moment.")
+            return
+        if summary_status == "failed":
+            st.warning("⚠️ The last summary attempt failed.")
+        else:
+            st.info("No summary available yet.")
         if st.button("🔄 Generate Summary", key="generate_summary_button"):
             success, result = generate_summary_for_book(st.session_state.current_book_id)
             if success:
-                st.success("✅ Summary generated successfully!")
+                st.success("✅ Summary queued!")
                 st.rerun()
             else:
-                st.error(f"❌ Failed to generate summary: {result}")
+                st.error(f"❌ Failed to queue summary: {result}")
 
 def render_history_tab():
     """Render the history tab"""
@@ -523,9 +548,9 @@ def render_analytics_page():
     """Render the analytics page"""
     st.header("📊 Analytics Dashboard")
     
-    books = st.session_state.db.get_all_books()
+    analytics = st.session_state.db.get_library_analytics(top_n=5)
     
-    if not books:
+    if not analytics["total_books"]:
         st.info("No books uploaded yet!")
         return
     
@@ -533,19 +558,16 @@ def render_analytics_page():
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Books", len(books))
+        st.metric("Total Books", analytics["total_books"])
     
     with col2:
-        total_pages = sum(book[3] or 0 for book in books)
-        st.metric("Total Pages", total_pages)
+        st.metric("Total Pages", analytics["total_pages"])
     
     with col3:
-        total_chars = sum(int(book[4] or 0) for book in books)
-        st.metric("Total Characters", f"{total_chars:,}")
+        st.metric("Total Characters", f"{int(analytics['total_chars']):,}")
     
     with col4:
-        total_chats = sum(len(st.session_state.db.get_chat_history(book[0])) for book in books)
-        st.metric("Total Conversations", total_chats)
+        st.metric("Total Conversations", analytics["total_chats"])
     
     # Charts and visualizations
     st.subheader("📈 Usage Statistics")
@@ -554,19 +576,13 @@ def render_analytics_page():
     
     with col1:
         st.subheader("📚 Books by Size")
-        # Simple bar chart of book sizes
-        book_sizes = [(book[1], book[4] or 0) for book in books]
-        book_sizes.sort(key=lambda x: x[1], reverse=True)
-        
-        for title, size in book_sizes[:5]:
+        for title, size in analytics["largest_books"]:
             st.markdown(f"**{title}:** {size:,} characters")
     
     with col2:
         st.subheader("🕒 Recent Activity")
-        recent_books = books[:5]
-        for book in recent_books:
-            book_id, title, filename, pages, chars, upload_date, last_accessed = book
-            st.caption(f"📖 {title} - Last accessed: {last_accessed}")
+        for book_id, title, last_accessed, chat_count in analytics["recent_books"]:
+            st.caption(f"📖 {title} - Last accessed: {last_accessed} - {chat_count} conversation(s)")
 
 def render_settings_page():
     """Render the settings page"""
@@ -576,14 +592,39 @@ def render_settings_page():
     
     # Database info
     st.markdown("**Database Information:**")
-    books = st.session_state.db.get_all_books()
-    st.markdown(f"- Total books: {len(books)}")
+    stats = st.session_state.db.get_library_stats()
+    st.markdown(f"- Total books: {stats['total_books']}")
     st.markdown(f"- Database file: books.db")
     
     # System info
     st.subheader("System Information")
     st.markdown(f"- Python version: {sys.version}")
     st.markdown(f"- Working directory: {os.getcwd()}")
+    st.markdown(f"- Resident memory: {get_rss_mb():,.0f} MB")
+    
+    # Loaded models
+    model_stats = model_registry.stats()
+    if model_stats:
+        st.markdown("**Loaded Models:**")
+        for stats in model_stats:
+            st.markdown(
+                f"- {stats['model_name']} ({stats['device']}): "
+                f"loaded in {stats['load_seconds']:.2f}s, +{stats['rss_delta_mb']:,.0f} MB"
+            )
+        query_cache = query_embedding_cache.stats()
+        st.markdown(
+            f"- Query embedding cache: {query_cache['entries']:,}/{query_cache['max_entries']:,} entries, "
+            f"{query_cache['hits']:,} hits, {query_cache['misses']:,} misses"
+        )
+    
+    # LLM load
+    st.markdown("**LLM Servers:**")
+    for llm_stats in get_llm_client().stats():
+        status = "🟢" if llm_stats['healthy'] else "🔴"
+        st.markdown(
+            f"- {status} {llm_stats['base_url']}: {llm_stats['in_flight']}/{llm_stats['max_concurrency']} generating, "
+            f"{llm_stats['queue_depth']} queued, {llm_stats['requests']} requests ({llm_stats['errors']} failed)"
+        )
     
     # Actions
     st.subheader("Actions")
@@ -628,7 +669,7 @@ def render_chat_input():
         st.rerun()
 
 def process_uploaded_files(uploaded_files):
-    """Process uploaded PDF files and store in database"""
+    """Save uploaded PDF files and queue them for background ingestion"""
     if not uploaded_files:
         return
     
@@ -636,84 +677,72 @@ def process_uploaded_files(uploaded_files):
     uploads_dir = Path("uploads")
     uploads_dir.mkdir(exist_ok=True)
     
-    processed_count = 0
+    job_queue = get_job_queue()
+    queued_count = 0
     
     for uploaded_file in uploaded_files:
         try:
+            filename = uploaded_file.name
+            file_bytes = uploaded_file.getvalue()
+            content_hash = hashlib.sha256(file_bytes).hexdigest()
+            
+            # Identical file uploaded before: reuse its text, embeddings and summary
+            existing_book = st.session_state.db.find_book_by_hash(content_hash)
+            if existing_book:
+                logger.info(f"{filename} matches book_id={existing_book[0]}, reusing collection {existing_book[4]}")
+                book_id = st.session_state.db.add_duplicate_book(
+                    existing_book, filename.replace('.pdf', ''), filename, content_hash
+                )
+                job_queue.submit_duplicate_summary(book_id, existing_book[4])
+                st.info(f"♻️ {filename} was already processed, reusing its content")
+                continue
+            
             # Generate unique filename
             file_id = str(uuid.uuid4())
-            filename = uploaded_file.name
             file_path = uploads_dir / f"{file_id}_{filename}"
             logger.info(f"Saving uploaded file: {file_path}")
             
             # Save file
             with open(file_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
+                f.write(file_bytes)
             
-            # Extract text from PDF
-            pages = extract_text_from_pdf(str(file_path))
-            if not pages or all(not t[1].strip() for t in pages):
-                logger.warning(f"No extractable text found in {filename}")
-                st.error(f"No extractable text found in {filename}")
-                continue
-            
-            # Calculate statistics
-            total_chars = sum(len(text) for _, text in pages)
-            total_pages = len(pages)
-            
-            # Generate collection name
-            collection_name = f"book_{file_id}"
-            logger.info(f"Embedding and storing vector store for: {collection_name}")
-            
-            # Store in vector database
-            vector_store = chunk_and_embed(
-                pages, 
-                persist_directory="./chroma_db", 
-                collection_name=collection_name
-            )
-            
-            # Add to database
-            book_id = st.session_state.db.add_book(
-                title=filename.replace('.pdf', ''),
-                filename=filename,
-                file_path=str(file_path),
-                collection_name=collection_name,
-                pages=total_pages,
-                total_chars=total_chars
-            )
-            
-            # --- Automatic summary generation ---
-            try:
-                llm = get_ollama_llm()
-                summary_chain = get_summary_chain(vector_store, llm)
-                logger.info(f"Generating summary for {filename} (book_id={book_id})")
-                with st.spinner(f"Generating summary for {filename}..."):
-                    summary_result = summary_chain()
-                    # Extract the result string from the dictionary
-                    if isinstance(summary_result, dict) and 'result' in summary_result:
-                        summary = summary_result['result']
-                    else:
-                        summary = str(summary_result)
-                if summary:
-                    st.session_state.db.add_summary(book_id, summary)
-                    logger.info(f"Summary generated and stored for {filename} (book_id={book_id})")
-                else:
-                    logger.warning(f"Summary chain returned no summary for {filename}")
-            except Exception as e:
-                logger.exception(f"Could not generate summary for {filename}: {e}")
-                st.warning(f"Could not generate summary for {filename}: {e}")
-            
-            processed_count += 1
+            job_id = job_queue.submit(INGEST_JOB, {
+                "file_path": str(file_path),
+                "filename": filename,
+                "collection_name": f"book_{file_id}",
+                "content_hash": content_hash,
+            }, priority=INGEST_PRIORITY)
+            logger.info(f"Queued ingestion job {job_id} for {filename}")
+            queued_count += 1
             
         except Exception as e:
-            logger.exception(f"Error processing {uploaded_file.name}: {e}")
-            st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
+            logger.exception(f"Error queueing {uploaded_file.name}: {e}")
+            st.error(f"❌ Error queueing {uploaded_file.name}: {str(e)}")
     
-    if processed_count > 0:
-        logger.info(f"Successfully processed {processed_count} file(s)")
-        st.success(f"✅ Successfully processed {processed_count} file(s)")
-        st.session_state.upload_processed = True
-        st.rerun()
+    if queued_count > 0:
+        logger.info(f"Queued {queued_count} file(s) for processing")
+        st.success(f"✅ Queued {queued_count} file(s) for processing")
+    st.session_state.upload_processed = True
+
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "⚙️", "done": "✅", "failed": "❌"}
+JOB_TYPE_LABELS = {INGEST_JOB: "Upload", SUMMARY_JOB: "Summary"}
+
+@st.fragment(run_every=2)
+def render_job_status():
+    """Render background upload and summary jobs, refreshing on its own while the rest of the page stays put"""
+    jobs = st.session_state.db.get_recent_jobs(limit=10)
+    if not jobs:
+        return
+    st.subheader("⚙️ Processing Queue")
+    for job_id, job_type, status, progress, message, book_id, created_at, finished_at in jobs:
+        icon = JOB_STATUS_ICONS.get(status, "•")
+        label = f"{icon} {JOB_TYPE_LABELS.get(job_type, job_type)} #{job_id} ({status})"
+        if message:
+            label += f" - {message}"
+        if status in ("queued", "running"):
+            st.progress(min(1.0, progress or 0.0), text=label)
+        else:
+            st.caption(label)
 
 def render_footer():
     """Render the footer"""
@@ -741,6 +770,8 @@ def main_ui():
         render_upload_page()
     elif st.session_state.current_page == "library":
         render_library_page()
+    elif st.session_state.current_page == "search":
+        render_search_page()
     elif st.session_state.current_page == "analytics":
         render_analytics_page()
     elif st.session_state.current_page == "settings":
@@ -1,40 +1,114 @@
 import PyPDF2
-from pdfminer.high_level import extract_text as pdfminer_extract
-import tempfile
+from pdfminer.high_level import extract_text as pdfminer_extract, extract_pages
+from pdfminer.layout import LTTextContainer
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from core.config import PDF_EXTRACT_WORKERS
 
+# Pages handed to each worker task; small enough to balance uneven pages
+PAGES_PER_SHARD = 16
 
-def extract_text_from_pdf(pdf_path):
+
+def _extract_pages_with_pdfminer(pdf_path, page_indexes):
     """
-    Extract text from PDF using PyPDF2, fallback to pdfminer if needed.
+    Extract several pages with pdfminer in a single pass over the file.
+    page_indexes: zero-based page indexes
+    Returns a dict of page index -> text.
+    """
+    page_indexes = sorted(page_indexes)
+    texts = {}
+    # extract_pages yields the selected pages in document order
+    for page_index, layout in zip(page_indexes, extract_pages(pdf_path, page_numbers=page_indexes)):
+        texts[page_index] = "".join(
+            element.get_text() for element in layout if isinstance(element, LTTextContainer)
+        )
+    return texts
+
+
+def _extract_page_range(pdf_path, start, end):
+    """
+    Extract pages [start, end) of a PDF. Opens the file itself so it can run in a worker process.
     Returns a list of (page_num, text) tuples.
     """
-    texts = []
+    page_texts = {}
+    empty_pages = []
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for i in range(start, end):
+            page_text = pdf_reader.pages[i].extract_text()
+            if page_text and page_text.strip():
+                page_texts[i] = page_text
+            else:
+                empty_pages.append(i)
+    
+    # Fallback to pdfminer for all pages PyPDF2 couldn't read, in one batch
+    if empty_pages:
+        page_texts.update(_extract_pages_with_pdfminer(pdf_path, empty_pages))
+    
+    return [(i + 1, page_texts[i]) for i in sorted(page_texts) if page_texts[i] and page_texts[i].strip()]
+
+
+def get_pdf_page_count(pdf_path):
+    """Return the number of pages in a PDF"""
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def _iter_shards(pdf_path, num_pages, workers):
+    """Yield the (page_num, text) lists of each page shard, in page order"""
+    shards = [(start, min(start + PAGES_PER_SHARD, num_pages))
+              for start in range(0, num_pages, PAGES_PER_SHARD)]
+    if workers <= 1 or len(shards) <= 1:
+        for start, end in shards:
+            yield _extract_page_range(pdf_path, start, end)
+        return
+    
+    # Keep a bounded window of shards in flight so a large book is never fully buffered
+    max_in_flight = workers * 2
+    # Spawned workers: forking a process with live torch, event-loop and SQLite threads can deadlock
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(shards)), mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending = deque()
+        next_shard = 0
+        while pending or next_shard < len(shards):
+            while next_shard < len(shards) and len(pending) < max_in_flight:
+                start, end = shards[next_shard]
+                pending.append(executor.submit(_extract_page_range, pdf_path, start, end))
+                next_shard += 1
+            # Waiting on the oldest future keeps results in page order
+            yield pending.popleft().result()
+
+
+def iter_text_from_pdf(pdf_path, workers=PDF_EXTRACT_WORKERS):
+    """
+    Lazily extract text from PDF using PyPDF2, fallback to pdfminer if needed.
+    With workers > 1, page ranges are extracted in a process pool and yielded in page order.
+    Yields (page_num, text) tuples.
+    """
+    yielded = False
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for i, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    texts.append((i + 1, page_text))
-                else:
-                    # Fallback to pdfminer for this page
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_page:
-                        writer = PyPDF2.PdfWriter()
-                        writer.add_page(page)
-                        writer.write(tmp_page)
-                        tmp_page_path = tmp_page.name
-                    try:
-                        miner_text = pdfminer_extract(tmp_page_path)
-                        if miner_text and miner_text.strip():
-                            texts.append((i + 1, miner_text))
-                    finally:
-                        import os
-                        os.unlink(tmp_page_path)
-        return texts
+        num_pages = get_pdf_page_count(pdf_path)
+        for shard_texts in _iter_shards(pdf_path, num_pages, workers):
+            for page in shard_texts:
+                yielded = True
+                yield page
     except Exception:
+        if yielded:
+            # Part of the book was already consumed, a whole-file fallback would duplicate it
+            raise
         # Fallback to pdfminer for the whole file
         try:
             full_text = pdfminer_extract(pdf_path)
-            return [(1, full_text)]
         except Exception:
-            return [] 
\ No newline at end of file
+            return
+        yield (1, full_text)
+
+
+def extract_text_from_pdf(pdf_path, workers=PDF_EXTRACT_WORKERS):
+    """
+    Extract text from PDF using PyPDF2, fallback to pdfminer if needed.
+    Returns a list of (page_num, text) tuples.
+    """
+    return list(iter_text_from_pdf(pdf_path, workers=workers))
@@ -8,6 +8,10 @@ import sys
 import os
 import tempfile
 import shutil
+import time
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 # Add src to path for imports
@@ -17,9 +21,85 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sqlite3
 
-from core.database import BookDatabase
-from utils.pdf_utils import extract_text_from_pdf
-from core.rag_chain import chunk_and_embed, get_ollama_llm, get_qa_chain, get_summary_chain
+import httpx
+import PyPDF2
+
+try:
+    from reportlab.pdfgen import canvas
+    HAS_REPORTLAB = True
+except ImportError:
+    HAS_REPORTLAB = False
+
+from core.database import BookDatabase, SCHEMA_VERSION
+from utils.pdf_utils import extract_text_from_pdf, iter_text_from_pdf
+from core.rag_chain import (
+    chunk_and_embed, get_ollama_llm, get_qa_chain, get_summary_chain, get_embeddings, get_chunk_count,
+    stream_qa_answer, load_existing_vector_store
+)
+from core.model_registry import model_registry
+from core.vector_store_pool import VectorStorePool, vector_store_pool
+from core.ingestion import IngestionEngine
+from core.embedding_cache import (
+    EmbeddingCache, CachedEmbeddings, QueryEmbeddingCache, QueryCachedEmbeddings,
+    query_embedding_cache
+)
+from core.jobs import (
+    JobQueue, INGEST_JOB, SUMMARY_JOB, INGEST_PRIORITY, REQUESTED_SUMMARY_PRIORITY, run_ingest_job, run_summary_job,
+    queue_summary, queue_duplicate_summary
+)
+from core.connection_pool import get_connection, close_thread_connections
+from core.answer_cache import AnswerCache
+from core.llm_client import OllamaClient, OllamaRouter, PooledOllama
+from core.summarizer import HierarchicalSummarizer, get_book_chunks
+from core.lexical_index import LexicalIndex
+from core.retrieval import HybridRetriever, reciprocal_rank_fusion
+from core.library_search import search_library
+from core.vector_backends import NumpyFlatStore, open_vector_store, detect_vector_backend
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Mimics Ollama's /api/generate endpoint, recording connections and concurrency"""
+    protocol_version = "HTTP/1.1"
+    
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+    
+    def do_GET(self):
+        body = json.dumps({"models": [{"name": "llama2"}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.active -= 1
+        
+        words = ["Hello", " from", " ", request["model"]]
+        if request.get("stream"):
+            lines = [{"response": word, "done": False} for word in words] + [{"response": "", "done": True}]
+            body = "".join(json.dumps(line) + "\n" for line in lines).encode()
+        else:
+            body = json.dumps({"response": "".join(words), "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            # The client already gave up on this request
+            pass
+    
+    def log_message(self, format, *args):
+        pass
 
 class TestBookRAGAssistant(unittest.TestCase):
     
@@ -38,9 +118,22 @@ class TestBookRAGAssistant(unittest.TestCase):
         # Initialize test database
         self.db = BookDatabase(db_path=self.db_path)
         
+        # Make sure no mocked model or handle leaks between tests
+        model_registry.clear()
+        vector_store_pool.clear()
+        query_embedding_cache.clear()
+        
+        # Keep the persistent embedding cache out of the working directory
+        self.cache_patcher = patch('core.rag_chain.get_embedding_cache', return_value=None)
+        self.cache_patcher.start()
+        
     def tearDown(self):
         """Clean up test environment"""
+        self.cache_patcher.stop()
+        close_thread_connections()
         shutil.rmtree(self.test_dir, ignore_errors=True)
+        model_registry.clear()
+        vector_store_pool.clear()
     
     def test_database_operations(self):
         """Test database operations"""
@@ -81,6 +174,174 @@ class TestBookRAGAssistant(unittest.TestCase):
         self.assertIsNotNone(summary)
         self.assertEqual(summary[0], "This is a comprehensive summary of the test book.")
     
+    def test_duplicate_books_share_content(self):
+        """Test content hash lookup and that shared files survive deleting one record"""
+        pdf_path = os.path.join(self.uploads_dir, "shared.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF-1.4 shared")
+        
+        original_id = self.db.add_book(
+            title="Original", filename="original.pdf", file_path=pdf_path,
+            collection_name="shared_collection", pages=3, total_chars=300, content_hash="abc123"
+        )
+        self.assertIsNone(self.db.find_book_by_hash("missing"))
+        match = self.db.find_book_by_hash("abc123")
+        self.assertEqual(match[0], original_id)
+        self.assertEqual(match[4], "shared_collection")
+        
+        duplicate_id = self.db.add_book(
+            title="Copy", filename="copy.pdf", file_path=pdf_path,
+            collection_name="shared_collection", pages=3, total_chars=300, content_hash="abc123"
+        )
+        self.assertEqual(self.db.find_book_by_hash("abc123")[0], original_id)
+        
+        self.db.delete_book(original_id)
+        self.assertTrue(os.path.exists(pdf_path))
+        self.assertEqual(self.db.find_book_by_hash("abc123")[0], duplicate_id)
+        
+        self.db.delete_book(duplicate_id)
+        self.assertFalse(os.path.exists(pdf_path))
+    
+    def test_content_hash_column_added_to_old_database(self):
+        """Test databases created before content hashing gain the column"""
+        old_db_path = os.path.join(self.test_dir, "old_books.db")
+        conn = sqlite3.connect(old_db_path)
+        conn.execute('''
+            CREATE TABLE books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                collection_name TEXT NOT NULL,
+                pages INTEGER,
+                total_chars INTEGER,
+                upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+        
+        db = BookDatabase(db_path=old_db_path)
+        book_id = db.add_book("Old", "old.pdf", "/path/old.pdf", "old_collection", content_hash="def456")
+        self.assertEqual(db.find_book_by_hash("def456")[0], book_id)
+    
+    def test_connections_are_pooled_per_thread(self):
+        """Test each thread reuses one tuned WAL connection"""
+        import threading
+        conn = get_connection(self.db_path)
+        self.assertIs(get_connection(self.db_path), conn)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)
+        
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_connection(self.db_path)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+        
+        # A failed write is rolled back instead of leaving the shared connection mid-transaction
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.add_book(title=None, filename="x.pdf", file_path="/x.pdf", collection_name="x")
+        self.assertFalse(conn.in_transaction)
+    
+    def test_migrations_index_history_and_cascade_deletes(self):
+        """Test the schema is versioned, history lookups are indexed and deletes cascade"""
+        self.assertEqual(self.db.get_schema_version(), SCHEMA_VERSION)
+        
+        conn = get_connection(self.db_path)
+        plan = conn.execute('''
+            EXPLAIN QUERY PLAN
+            SELECT question FROM chat_history WHERE book_id = ? ORDER BY timestamp DESC LIMIT 50
+        ''', (1,)).fetchall()
+        self.assertIn("idx_chat_history_book_timestamp", str(plan))
+        
+        book_id = self.db.add_book("Cascade", "cascade.pdf", "/path/cascade.pdf", "cascade_collection")
+        self.db.add_chat_history(book_id, "Q?", "A.")
+        self.db.add_summary(book_id, "Summary.")
+        conn.execute('DELETE FROM books WHERE id = ?', (book_id,))
+        conn.commit()
+        self.assertEqual(self.db.get_chat_history(book_id), [])
+        self.assertIsNone(self.db.get_latest_summary(book_id))
+    
+    def test_migrations_upgrade_legacy_database(self):
+        """Test an unversioned database keeps its rows and drops orphaned history"""
+        legacy_path = os.path.join(self.test_dir, "legacy_books.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.executescript('''
+            CREATE TABLE books (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL,
+                filename TEXT NOT NULL, file_path TEXT NOT NULL, collection_name TEXT NOT NULL,
+                pages INTEGER, total_chars INTEGER,
+                upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE chat_history (id INTEGER PRIMARY KEY AUTOINCREMENT, book_id INTEGER,
+                question TEXT NOT NULL, answer TEXT NOT NULL, sources TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (book_id) REFERENCES books (id));
+            CREATE TABLE summaries (id INTEGER PRIMARY KEY AUTOINCREMENT, book_id INTEGER,
+                summary TEXT NOT NULL, generated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (book_id) REFERENCES books (id));
+            INSERT INTO books (title, filename, file_path, collection_name) VALUES ('Kept', 'kept.pdf', '/kept.pdf', 'kept');
+            INSERT INTO chat_history (book_id, question, answer) VALUES (1, 'Kept?', 'Yes.');
+            INSERT INTO chat_history (book_id, question, answer) VALUES (99, 'Orphan?', 'Gone.');
+        ''')
+        conn.close()
+        
+        db = BookDatabase(db_path=legacy_path)
+        self.assertEqual(db.get_schema_version(), SCHEMA_VERSION)
+        self.assertEqual(db.get_book_by_id(1)[1], "Kept")
+        self.assertEqual([row[0] for row in db.get_chat_history(1)], ["Kept?"])
+        self.assertEqual(db.get_chat_history(99), [])
+    
+    def test_count_and_analytics_queries(self):
+        """Test counts are exact beyond the history page size and analytics aggregate correctly"""
+        small_id = self.db.add_book("Small", "small.pdf", "/small.pdf", "small", pages=2, total_chars=100)
+        large_id = self.db.add_book("Large", "large.pdf", "/large.pdf", "large", pages=10, total_chars=5000)
+        empty_id = self.db.add_book("Empty", "empty.pdf", "/empty.pdf", "empty")
+        for i in range(60):
+            self.db.add_chat_history(large_id, f"Q{i}", f"A{i}")
+        self.db.add_chat_history(small_id, "Q", "A")
+        
+        self.assertEqual(len(self.db.get_chat_history(large_id)), 50)
+        self.assertEqual(self.db.count_chat_history(large_id), 60)
+        self.assertEqual(self.db.count_chat_history(empty_id), 0)
+        self.assertEqual(self.db.get_chat_counts(), {large_id: 60, small_id: 1})
+        
+        analytics = self.db.get_library_analytics(top_n=2)
+        self.assertEqual(analytics["total_books"], 3)
+        self.assertEqual(analytics["total_pages"], 12)
+        self.assertEqual(analytics["total_chars"], 5100)
+        self.assertEqual(analytics["total_chats"], 61)
+        self.assertEqual(analytics["largest_books"], [("Large", 5000), ("Small", 100)])
+        self.assertEqual(len(analytics["recent_books"]), 2)
+        chat_counts = {row[0]: row[3] for row in analytics["recent_books"]}
+        self.assertTrue(all(count == {large_id: 60, small_id: 1}.get(book_id, 0) for book_id, count in chat_counts.items()))
+    
+    def test_search_books_sorts_and_paginates_in_sql(self):
+        """Test library search, sort and pagination happen in the query"""
+        self.db.add_book("Python Tricks", "tricks.pdf", "/tricks.pdf", "c1", total_chars=300)
+        self.db.add_book("Learning Python", "learning.pdf", "/learning.pdf", "c2", total_chars=900)
+        self.db.add_book("Influence", "persuasion.pdf", "/persuasion.pdf", "c3", total_chars=600)
+        
+        self.assertEqual(self.db.count_books(), 3)
+        self.assertEqual(self.db.count_books("pyth"), 2)
+        self.assertEqual([b[1] for b in self.db.search_books("persuasion")], ["Influence"])
+        self.assertEqual([b[1] for b in self.db.search_books("learning python")], ["Learning Python"])
+        self.assertEqual(self.db.search_books("nothing here"), [])
+        
+        by_name = [b[1] for b in self.db.search_books(sort_by="Name")]
+        self.assertEqual(by_name, ["Influence", "Learning Python", "Python Tricks"])
+        by_size = [b[1] for b in self.db.search_books(sort_by="Size", limit=2, offset=1)]
+        self.assertEqual(by_size, ["Influence", "Python Tricks"])
+        
+        # Renames and deletes keep the full-text index in sync
+        conn = get_connection(self.db_path)
+        conn.execute("UPDATE books SET title = 'Advanced Tricks' WHERE title = 'Python Tricks'")
+        conn.commit()
+        self.assertEqual(self.db.count_books("pyth"), 1)
+        self.db.delete_book(self.db.search_books("influence")[0][0])
+        self.assertEqual(self.db.count_books("influence"), 0)
+    
     def test_pdf_utils(self):
         """Test PDF utilities"""
         # Create a simple test PDF content
@@ -92,14 +353,301 @@ class TestBookRAGAssistant(unittest.TestCase):
             result = extract_text_from_pdf("test.pdf")
             self.assertEqual(result, test_pages)
     
+    def create_test_pdf(self, num_pages):
+        """Write a PDF with one line of numbered text per page"""
+        pdf_path = os.path.join(self.test_dir, "test_book.pdf")
+        c = canvas.Canvas(pdf_path)
+        for i in range(num_pages):
+            c.drawString(100, 750, f"This is page {i + 1} of the test book.")
+            c.showPage()
+        c.save()
+        return pdf_path
+    
+    @unittest.skipUnless(HAS_REPORTLAB, "reportlab is required to build test PDFs")
+    def test_parallel_pdf_extraction(self):
+        """Test parallel extraction returns the same pages in order as serial extraction"""
+        pdf_path = self.create_test_pdf(40)
+        
+        serial = extract_text_from_pdf(pdf_path, workers=1)
+        parallel = extract_text_from_pdf(pdf_path, workers=3)
+        
+        self.assertEqual(len(serial), 40)
+        self.assertEqual(parallel, serial)
+        self.assertEqual([page_num for page_num, _ in parallel], list(range(1, 41)))
+        self.assertIn("page 40", parallel[-1][1])
+    
+    @unittest.skipUnless(HAS_REPORTLAB, "reportlab is required to build test PDFs")
+    def test_pdfminer_fallback_is_batched(self):
+        """Test pages PyPDF2 can't read are extracted by pdfminer in one pass"""
+        import utils.pdf_utils as pdf_utils
+        pdf_path = self.create_test_pdf(5)
+        
+        with patch('PyPDF2.PageObject.extract_text', return_value=""):
+            with patch('utils.pdf_utils.extract_pages', wraps=pdf_utils.extract_pages) as mock_extract_pages:
+                with patch('tempfile.NamedTemporaryFile') as mock_tempfile:
+                    pages = extract_text_from_pdf(pdf_path, workers=1)
+        
+        mock_extract_pages.assert_called_once()
+        mock_tempfile.assert_not_called()
+        self.assertEqual([page_num for page_num, _ in pages], [1, 2, 3, 4, 5])
+        self.assertIn("page 3", pages[2][1])
+    
+    @unittest.skipUnless(HAS_REPORTLAB, "reportlab is required to build test PDFs")
+    def test_streaming_pdf_extraction(self):
+        """Test the page generator yields pages lazily and feeds chunk_and_embed"""
+        import types
+        pdf_path = self.create_test_pdf(20)
+        
+        pages = iter_text_from_pdf(pdf_path, workers=1)
+        self.assertIsInstance(pages, types.GeneratorType)
+        self.assertEqual(next(pages)[0], 1)
+        
+        with patch('core.rag_chain.HuggingFaceEmbeddings') as mock_embeddings:
+            with patch('core.vector_backends.ChromaStore'):
+                mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[0.0] for _ in texts]
+                vector_store, stats = chunk_and_embed(
+                    iter_text_from_pdf(pdf_path, workers=2),
+                    persist_directory=self.chroma_dir,
+                    collection_name="streamed_collection",
+                    total_pages=20,
+                    return_stats=True
+                )
+        
+        self.assertIsNotNone(vector_store)
+        self.assertEqual(stats.pages, 20)
+        self.assertEqual(stats.chunks, 20)
+        self.assertEqual(stats.progress, 1.0)
+    
     def test_rag_chain(self):
         """Test RAG chain functionality"""
         # Test LLM initialization
-        with patch('core.rag_chain.Ollama') as mock_ollama:
-            mock_llm = MagicMock()
-            mock_ollama.return_value = mock_llm
-            llm = get_ollama_llm()
-            self.assertIsNotNone(llm)
+        llm = get_ollama_llm()
+        self.assertIsInstance(llm, PooledOllama)
+        self.assertEqual(llm.model, "llama2")
+        self.assertIs(llm.client, get_ollama_llm().client)
+    
+    def start_stub_ollama(self, delay=0.0):
+        """Serve StubOllamaHandler on a free local port for the duration of the test"""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+        server.daemon_threads = True
+        server.connections = server.requests = server.active = server.max_active = 0
+        server.delay = delay
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f"http://127.0.0.1:{server.server_address[1]}"
+    
+    def test_llm_client_generate_and_stream(self):
+        """Test the pooled client against a stub Ollama server, reusing one connection"""
+        server, base_url = self.start_stub_ollama()
+        client = OllamaClient(base_url=base_url, max_concurrency=2, timeout=5)
+        self.addCleanup(client.close)
+        
+        self.assertEqual(client.generate("Hi", "llama2"), "Hello from llama2")
+        self.assertEqual(list(client.stream("Hi", "llama2")), ["Hello", " from", " ", "llama2"])
+        
+        llm = PooledOllama(model="mistral", client=client)
+        self.assertEqual(llm.invoke("Hi"), "Hello from mistral")
+        self.assertEqual("".join(llm.stream("Hi")), "Hello from mistral")
+        
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(client.stats()["requests"], 4)
+        self.assertEqual(client.stats()["in_flight"], 0)
+    
+    def test_llm_client_limits_concurrency(self):
+        """Test generations beyond max_concurrency queue up and are reported in queue_depth"""
+        server, base_url = self.start_stub_ollama(delay=0.3)
+        client = OllamaClient(base_url=base_url, max_concurrency=1, timeout=5)
+        self.addCleanup(client.close)
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.generate("Hi", "llama2"))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        
+        max_queue_depth = 0
+        while any(thread.is_alive() for thread in threads):
+            max_queue_depth = max(max_queue_depth, client.stats()["queue_depth"])
+            time.sleep(0.01)
+        
+        self.assertEqual(results, ["Hello from llama2"] * 3)
+        self.assertEqual(server.max_active, 1)
+        self.assertEqual(max_queue_depth, 2)
+    
+    def test_llm_client_times_out(self):
+        """Test a slow server fails the request instead of blocking forever"""
+        server, base_url = self.start_stub_ollama(delay=1.0)
+        client = OllamaClient(base_url=base_url, timeout=0.2)
+        self.addCleanup(client.close)
+        
+        with self.assertRaises(httpx.TimeoutException):
+            client.generate("Hi", "llama2")
+        self.assertEqual(client.stats()["errors"], 1)
+    
+    def test_llm_router_balances_and_fails_over(self):
+        """Test the router spreads concurrent requests and fails over from a dead endpoint"""
+        first, first_url = self.start_stub_ollama(delay=0.3)
+        second, second_url = self.start_stub_ollama(delay=0.3)
+        dead = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+        dead_url = f"http://127.0.0.1:{dead.server_address[1]}"
+        dead.server_close()
+        
+        router = OllamaRouter(
+            endpoints=[dead_url, first_url, second_url], health_check_interval=0,
+            client_factory=lambda base_url: OllamaClient(base_url=base_url, max_concurrency=1, timeout=5)
+        )
+        self.addCleanup(router.close)
+        
+        # The dead endpoint is tried first, then dropped from rotation
+        self.assertEqual("".join(router.stream("Hi", "llama2")), "Hello from llama2")
+        self.assertEqual(router.generate("Hi", "llama2"), "Hello from llama2")
+        self.assertEqual((first.requests, second.requests), (2, 0))
+        self.assertEqual([s["healthy"] for s in router.stats()], [False, True, True])
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(router.generate("Hi", "llama2"))) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["Hello from llama2"] * 2)
+        self.assertEqual((first.requests, second.requests), (3, 1))
+        
+        self.assertEqual(router.check_health(), {dead_url: False, first_url: True, second_url: True})
+    
+    def test_stream_qa_answer(self):
+        """Test the streaming QA path retrieves context and yields LLM tokens lazily"""
+        from langchain_core.documents import Document
+        
+        docs = [Document(page_content="Dragons live here.", metadata={"page": 3})]
+        llm = MagicMock()
+        llm.stream.return_value = iter(["Drag", "ons", "."])
+        
+        with patch('core.rag_chain.get_retriever') as mock_retriever:
+            mock_retriever.return_value.invoke.return_value = docs
+            source_documents, tokens = stream_qa_answer(MagicMock(), llm, "Who lives here?")
+        
+        self.assertEqual(source_documents, docs)
+        prompt_text = llm.stream.call_args[0][0]
+        self.assertIn("Dragons live here.", prompt_text)
+        self.assertIn("Question: Who lives here?", prompt_text)
+        self.assertEqual("".join(tokens), "Dragons.")
+    
+    def test_hierarchical_summary_covers_book_and_reuses_nodes(self):
+        """Test the map-reduce summarizer reads every chunk and only regenerates changed nodes"""
+        prompts = []
+        
+        def invoke(prompt):
+            prompts.append(prompt)
+            return f"summary {len(prompts)}"
+        
+        llm = MagicMock(model="llama2")
+        llm.invoke.side_effect = invoke
+        chunks = [f"Chunk {i} of the book." for i in range(20)]
+        
+        summarizer = HierarchicalSummarizer(llm, db_path=self.db_path, group_chars=50, fanout=3)
+        summary = summarizer.summarize("book_test", chunks)
+        
+        # 10 leaves -> 4 -> 2 -> final
+        self.assertEqual(len(prompts), 17)
+        self.assertEqual(summary, "summary 17")
+        leaf_text = "".join(prompts[:10])
+        self.assertTrue(all(chunk in leaf_text for chunk in chunks))
+        
+        prompts.clear()
+        self.assertEqual(summarizer.summarize("book_test", chunks), "summary 17")
+        self.assertEqual(prompts, [])
+        
+        # Changing the last chunk only redoes its path to the root
+        summarizer.summarize("book_test", chunks[:-1] + ["A revised ending."])
+        self.assertEqual(len(prompts), 4)
+        conn = get_connection(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM summary_nodes").fetchone()[0], 17)
+    
+    def test_get_book_chunks_orders_by_page_and_chunk(self):
+        """Test the summarizer reads chunks back in book order"""
+        vector_store = MagicMock()
+        vector_store.get_chunks.return_value = (
+            ["chunk_10", "chunk_2", "chunk_1"],
+            ["third", "second", "first"],
+            [{"page": 2}, {"page": 1}, {"page": 1}],
+        )
+        self.assertEqual(get_book_chunks(vector_store), ["first", "second", "third"])
+    
+    def test_lexical_index_ranks_exact_terms(self):
+        """Test the FTS5 keyword index finds rare exact terms and is dropped with its collection"""
+        index = LexicalIndex(self.chroma_dir, "book_test-1")
+        self.assertFalse(index.exists())
+        self.assertEqual(index.search("anything", 5), [])
+        
+        index.add(
+            ["chunk_0", "chunk_1", "chunk_2"],
+            ["The ship sailed at dawn.", "Captain Ahab hunted the whale.", "The whale dove deep."],
+            [{"page": 1}, {"page": 2}, {"page": 3}],
+        )
+        # Re-indexing a chunk replaces it rather than duplicating it
+        index.add(["chunk_2"], ["The white whale dove deep."], [{"page": 3}])
+        
+        self.assertEqual(index.count(), 3)
+        self.assertEqual(index.search("Who is Ahab?", 5), [("chunk_1", "Captain Ahab hunted the whale.", 2)])
+        # Porter stemming matches "whales" to "whale"
+        self.assertCountEqual([row[0] for row in index.search("whales", 5)], ["chunk_1", "chunk_2"])
+        self.assertEqual(index.search("?!", 5), [])
+        
+        index.drop()
+        self.assertFalse(index.exists())
+    
+    def test_hybrid_retriever_fuses_dense_and_lexical_results(self):
+        """Test reciprocal rank fusion favours chunks found by both retrievers"""
+        from langchain_core.documents import Document
+        
+        a, b, c = (Document(page_content=text, metadata={"page": i}) for i, text in enumerate("abc"))
+        self.assertEqual(reciprocal_rank_fusion([[a, b, c], [b]], k=2), [b, a])
+        
+        vector_store = MagicMock()
+        vector_store.similarity_search.return_value = [a, b]
+        lexical_index = MagicMock()
+        lexical_index.search.return_value = [("chunk_2", "c", 2), ("chunk_1", "b", 1)]
+        retriever = HybridRetriever(vector_store=vector_store, lexical_index=lexical_index, k=2, fetch_k=10)
+        
+        self.assertEqual([doc.page_content for doc in retriever.invoke("question")], ["b", "a"])
+        vector_store.similarity_search.assert_called_once_with("question", k=10)
+    
+    def test_search_library_merges_collections(self):
+        """Test library search queries every collection once and merges the closest passages"""
+        from langchain_core.documents import Document
+        
+        first_id = self.db.add_book("Sea Book", "sea.pdf", "/tmp/sea.pdf", "book_sea", 10, 100)
+        self.db.add_book("Sea Book Copy", "sea.pdf", "/tmp/sea.pdf", "book_sea", 10, 100)
+        land_id = self.db.add_book("Land Book", "land.pdf", "/tmp/land.pdf", "book_land", 10, 100)
+        self.db.add_book("Broken Book", "broken.pdf", "/tmp/broken.pdf", "book_broken", 10, 100)
+        self.db.add_book("Empty Book", "empty.pdf", "/tmp/empty.pdf", "book_empty", 0, 0)
+        
+        results = {
+            "book_sea": [(Document(page_content="Whales", metadata={"page": 4}), 0.1),
+                         (Document(page_content="Ships", metadata={"page": 9}), 0.5)],
+            "book_land": [(Document(page_content="Horses", metadata={"page": 2}), 0.3)],
+        }
+        
+        def load(persist_directory, collection_name):
+            if collection_name == "book_broken":
+                raise RuntimeError("corrupt collection")
+            vector_store = MagicMock()
+            vector_store.similarity_search_by_vector_with_relevance_scores.return_value = results[collection_name]
+            return vector_store
+        
+        embed_query = MagicMock(return_value=[1.0, 0.0])
+        with patch('core.library_search.get_vector_store', side_effect=load) as mock_load:
+            hits = search_library(self.db, "animals", k=2, persist_directory=self.chroma_dir, embed_query=embed_query)
+        
+        embed_query.assert_called_once_with("animals")
+        self.assertEqual(mock_load.call_count, 3)
+        self.assertEqual(
+            [(hit["book_id"], hit["content"], hit["page"]) for hit in hits],
+            [(first_id, "Whales", 4), (land_id, "Horses", 2)]
+        )
+        self.assertEqual(search_library(self.db, "  ", embed_query=embed_query), [])
     
     def test_vector_store_operations(self):
         """Test vector store operations"""
@@ -107,7 +655,7 @@ class TestBookRAGAssistant(unittest.TestCase):
         test_pages = [(1, "This is test content for vectorization.")]
         
         with patch('core.rag_chain.HuggingFaceEmbeddings') as mock_embeddings:
-            with patch('core.rag_chain.Chroma') as mock_chroma:
+            with patch('core.vector_backends.ChromaStore') as mock_chroma:
                 mock_vector_store = MagicMock()
                 mock_chroma.from_texts.return_value = mock_vector_store
                 
@@ -119,6 +667,407 @@ class TestBookRAGAssistant(unittest.TestCase):
                 
                 self.assertIsNotNone(vector_store)
     
+    def test_embedding_model_is_loaded_once(self):
+        """Test the embedding model is shared across calls"""
+        with patch('core.rag_chain.HuggingFaceEmbeddings') as mock_embeddings:
+            first = get_embeddings()
+            second = get_embeddings()
+            
+            self.assertIs(first, second)
+            mock_embeddings.assert_called_once()
+            
+            stats = model_registry.stats()
+            self.assertEqual(len(stats), 1)
+            self.assertEqual(stats[0]["device"], "cpu")
+            self.assertIn("load_seconds", stats[0])
+            self.assertIn("rss_mb", stats[0])
+    
+    def test_query_embedding_cache(self):
+        """Test repeated queries skip the encoder and the cache stays bounded"""
+        model = MagicMock()
+        model.embed_query.side_effect = lambda text: [float(len(text)), 1.0]
+        cache = QueryEmbeddingCache(max_entries=2)
+        embeddings = QueryCachedEmbeddings(model, "minilm", cache)
+        
+        first = embeddings.embed_query("Who is Ahab?")
+        first.append(99.0)
+        self.assertEqual(embeddings.embed_query("  Who is   Ahab? "), [12.0, 1.0])
+        model.embed_query.assert_called_once_with("Who is Ahab?")
+        
+        embeddings.embed_query("q2")
+        embeddings.embed_query("q3")
+        embeddings.embed_query("Who is Ahab?")
+        self.assertEqual(model.embed_query.call_count, 4)
+        self.assertEqual(cache.stats(), {"entries": 2, "max_entries": 2, "hits": 1, "misses": 4})
+        
+        # Another model never sees these vectors
+        self.assertIsNone(cache.get("other-model", "q3"))
+    
+    def test_vector_store_pool_lru(self):
+        """Test pooled vector store handles are reused and evicted in LRU order"""
+        pool = VectorStorePool(max_size=2)
+        loader = MagicMock(side_effect=lambda: MagicMock())
+        
+        first = pool.get(self.chroma_dir, "book_a", loader)
+        self.assertIs(pool.get(self.chroma_dir, "book_a", loader), first)
+        self.assertEqual(loader.call_count, 1)
+        
+        pool.get(self.chroma_dir, "book_b", loader)
+        pool.get(self.chroma_dir, "book_a", loader)
+        pool.get(self.chroma_dir, "book_c", loader)
+        
+        # book_b was least recently used
+        self.assertEqual(len(pool), 2)
+        self.assertIn((self.chroma_dir, "book_a"), pool)
+        self.assertNotIn((self.chroma_dir, "book_b"), pool)
+        
+        # Failed loads are not cached
+        self.assertIsNone(pool.get(self.chroma_dir, "missing", lambda: None))
+        self.assertNotIn((self.chroma_dir, "missing"), pool)
+    
+    def test_delete_book_invalidates_vector_store(self):
+        """Test deleting a book drops its pooled vector store handle"""
+        book_id = self.db.add_book(
+            title="Pooled Book",
+            filename="pooled.pdf",
+            file_path="/path/to/pooled.pdf",
+            collection_name="pooled_collection"
+        )
+        vector_store_pool.put(self.chroma_dir, "pooled_collection", MagicMock())
+        self.assertIn((self.chroma_dir, "pooled_collection"), vector_store_pool)
+        
+        self.db.delete_book(book_id)
+        self.assertNotIn((self.chroma_dir, "pooled_collection"), vector_store_pool)
+    
+    def test_chunk_count(self):
+        """Test the emptiness check reads the collection count without querying"""
+        vector_store = MagicMock()
+        vector_store.count_chunks.return_value = 42
+        self.assertEqual(get_chunk_count(vector_store), 42)
+        vector_store.similarity_search.assert_not_called()
+        
+        broken_store = MagicMock()
+        broken_store.count_chunks.side_effect = RuntimeError("collection missing")
+        self.assertEqual(get_chunk_count(broken_store), 0)
+    
+    def test_ingestion_engine_batches(self):
+        """Test chunks are embedded and written in batches with progress reports"""
+        embeddings = MagicMock()
+        embeddings.embed_documents.side_effect = lambda texts: [[0.0, 1.0] for _ in texts]
+        vector_store = MagicMock()
+        progress = []
+        
+        pages = [(i + 1, f"Page {i + 1} text.") for i in range(5)]
+        engine = IngestionEngine(embeddings, batch_size=2)
+        stats = engine.run(pages, vector_store, progress_callback=lambda s: progress.append((s.chunks, s.progress)))
+        
+        self.assertEqual(stats.chunks, 5)
+        self.assertEqual(stats.batches, 3)
+        self.assertEqual(stats.pages, 5)
+        self.assertEqual(stats.chars, sum(len(text) for _, text in pages))
+        self.assertEqual([chunks for chunks, _ in progress], [2, 4, 5])
+        self.assertEqual(progress[-1][1], 1.0)
+        
+        calls = vector_store.upsert_chunks.call_args_list
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(calls[0].kwargs["ids"], ["chunk_0", "chunk_1"])
+        self.assertEqual(calls[2].kwargs["metadatas"], [{"page": 5}])
+        vector_store.flush.assert_called_once()
+    
+    def test_numpy_flat_store_round_trip(self):
+        """Test the memory-mapped backend stores, replaces and finds chunks like a brute-force search"""
+        import numpy as np
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(50, 8)).astype(np.float32)
+        ids = [f"chunk_{i}" for i in range(50)]
+        
+        # Batches are staged on disk, so a new handle can merge what a lost one wrote
+        store = NumpyFlatStore(self.chroma_dir, "numpy_book")
+        for start in range(0, 50, 20):
+            store.upsert_chunks(
+                ids[start:start + 20], vectors[start:start + 20],
+                [f"text {i}" for i in range(start, min(start + 20, 50))],
+                [{"page": i // 5} for i in range(start, min(start + 20, 50))]
+            )
+        self.assertEqual(len(os.listdir(store.staging_path)), 3)
+        self.assertEqual(store.count_chunks(), 0)
+        store = NumpyFlatStore(self.chroma_dir, "numpy_book")
+        store.flush()
+        self.assertEqual(store.count_chunks(), 50)
+        self.assertFalse(os.path.exists(store.staging_path))
+        
+        # Replacing a chunk keeps its row; the store is re-read from disk through mmap
+        store.upsert_chunks(["chunk_3"], [vectors[3]], ["text 3 revised"], [{"page": 0}])
+        store.flush()
+        self.assertEqual(detect_vector_backend(self.chroma_dir, "numpy_book"), "numpy")
+        reopened = open_vector_store(self.chroma_dir, "numpy_book", embeddings=None)
+        self.assertIsInstance(reopened, NumpyFlatStore)
+        self.assertEqual(reopened.count_chunks(), 50)
+        chunk_ids, documents, metadatas = reopened.get_chunks()
+        self.assertEqual(chunk_ids, ids)
+        self.assertEqual(documents[3], "text 3 revised")
+        self.assertEqual(metadatas[49], {"page": 9})
+        
+        query = rng.normal(size=8).astype(np.float32)
+        expected = np.argsort(((vectors - query) ** 2).sum(axis=1))[:5]
+        results = reopened.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=5)
+        self.assertEqual([doc.id for doc, _ in results], [ids[i] for i in expected])
+        self.assertAlmostEqual(results[0][1], float(((vectors[expected[0]] - query) ** 2).sum()), places=4)
+        
+        reopened.delete_collection()
+        self.assertEqual(detect_vector_backend(self.chroma_dir, "numpy_book"), "chroma")
+    
+    def test_quantized_first_pass_rescores_exactly(self):
+        """Test int8 and binary codes shrink the scanned index and re-scoring keeps exact distances"""
+        import numpy as np
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 64))
+        vectors = centers[np.arange(400) % 20] + 0.5 * rng.normal(size=(400, 64)) + rng.normal(size=64)
+        vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+        ids = [f"chunk_{i}" for i in range(400)]
+        query = vectors[7] + 0.01 * rng.normal(size=64).astype(np.float32)
+        exact = np.argsort(((vectors - query) ** 2).sum(axis=1))[:5]
+        
+        for quantization, code_bytes in (("int8", 400 * 64), ("binary", 400 * 8)):
+            store = NumpyFlatStore(self.chroma_dir, f"quantized_{quantization}", quantization=quantization, rescore_factor=10)
+            store.upsert_chunks(ids, vectors, [f"text {i}" for i in range(400)], [{} for _ in ids])
+            store.flush()
+            codes = np.load(os.path.join(store.path, "codes.npy"))
+            self.assertEqual(codes.nbytes, code_bytes)
+            
+            reopened = NumpyFlatStore(self.chroma_dir, f"quantized_{quantization}")
+            results = reopened.similarity_search_by_vector_with_relevance_scores(query, k=5)
+            self.assertEqual(reopened.quantization, quantization)
+            self.assertEqual(results[0][0].id, "chunk_7")
+            self.assertGreaterEqual(len({doc.id for doc, _ in results} & {ids[i] for i in exact}), 4)
+            self.assertAlmostEqual(results[0][1], float(((vectors[7] - query) ** 2).sum()), places=4)
+        
+        with self.assertRaises(ValueError):
+            open_vector_store(self.chroma_dir, "quantized_chroma", embeddings=None, backend="chroma", quantization="int8")
+    
+    def test_chunk_and_embed_numpy_backend(self):
+        """Test books can be ingested into the NumPy backend and reopened from the pool"""
+        with patch('core.rag_chain.HuggingFaceEmbeddings') as mock_embeddings:
+            mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+            mock_embeddings.return_value.embed_query.side_effect = lambda text: [float(len(text)), 1.0]
+            vector_store = chunk_and_embed(
+                [(1, "Short page."), (2, "A somewhat longer second page.")],
+                persist_directory=self.chroma_dir,
+                collection_name="numpy_collection",
+                backend="numpy"
+            )
+            self.assertIsInstance(vector_store, NumpyFlatStore)
+            self.assertEqual(get_chunk_count(vector_store), 2)
+            
+            vector_store_pool.invalidate("numpy_collection")
+            loaded = load_existing_vector_store(self.chroma_dir, "numpy_collection")
+            self.assertIsInstance(loaded, NumpyFlatStore)
+            self.assertEqual(loaded.similarity_search("Short text.", k=1)[0].metadata["page"], 1)
+    
+    def test_embedding_cache_skips_unchanged_chunks(self):
+        """Test cached chunks are not re-encoded and the cache stays bounded"""
+        cache = EmbeddingCache(db_path=os.path.join(self.test_dir, "embedding_cache.db"), max_entries=10)
+        model = MagicMock()
+        model.embed_documents.side_effect = lambda texts: [[float(len(t)), 0.5] for t in texts]
+        
+        encoder = CachedEmbeddings(model, "test-model", cache)
+        first = encoder.embed_documents(["alpha", "beta"])
+        second = encoder.embed_documents(["alpha", "beta", "gamma"])
+        
+        self.assertEqual(first, [[5.0, 0.5], [4.0, 0.5]])
+        self.assertEqual(second, [[5.0, 0.5], [4.0, 0.5], [5.0, 0.5]])
+        self.assertEqual(model.embed_documents.call_args_list[-1].args[0], ["gamma"])
+        self.assertEqual((encoder.hits, encoder.misses), (2, 3))
+        
+        # Other models never see these vectors
+        self.assertEqual(cache.get_many("other-model", ["alpha"]), [None])
+        
+        encoder.embed_documents([f"text {i}" for i in range(20)])
+        self.assertLessEqual(cache.count(), 10)
+    
+    def test_job_queue_runs_jobs_in_background(self):
+        """Test queued jobs are claimed by worker threads and their outcome recorded"""
+        queue = JobQueue(db_path=self.db_path, num_workers=2, poll_interval=0.05)
+        queue.handlers["echo"] = lambda db, job_id, payload: payload["book_id"]
+        queue.handlers["boom"] = MagicMock(side_effect=RuntimeError("broken"))
+        
+        ok_id = queue.submit("echo", {"book_id": 7})
+        failed_id = queue.submit("boom", {})
+        queue.start()
+        try:
+            for _ in range(100):
+                statuses = [self.db.get_job(job_id)[2] for job_id in (ok_id, failed_id)]
+                if all(status in ("done", "failed") for status in statuses):
+                    break
+                time.sleep(0.05)
+        finally:
+            queue.stop(timeout=5)
+        
+        ok_job = self.db.get_job(ok_id)
+        failed_job = self.db.get_job(failed_id)
+        self.assertEqual((ok_job[2], ok_job[3], ok_job[5]), ("done", 1.0, 7))
+        self.assertEqual((failed_job[2], failed_job[4]), ("failed", "broken"))
+    
+    def test_claim_next_job_respects_priority(self):
+        """Test higher-priority jobs are claimed first and interrupted jobs are requeued"""
+        low_id = self.db.add_job("echo", {"n": 1})
+        high_id = self.db.add_job("echo", {"n": 2}, priority=5)
+        
+        claimed = self.db.claim_next_job()
+        self.assertEqual(claimed[0], high_id)
+        self.assertEqual(claimed[2], {"n": 2})
+        self.assertEqual(self.db.claim_next_job()[0], low_id)
+        self.assertIsNone(self.db.claim_next_job())
+        
+        self.assertEqual(self.db.requeue_running_jobs(), 2)
+        self.assertEqual(self.db.get_job(high_id)[2], "queued")
+    
+    def test_ingest_job_adds_book_and_defers_summary(self):
+        """Test the ingest job records the book and leaves the summary to a lower-priority job"""
+        job_id = self.db.add_job(INGEST_JOB)
+        stats = MagicMock(chunks=3, pages=2, chars=120, progress=1.0, batch_chunks_per_second=10.0)
+        payload = {
+            "file_path": os.path.join(self.uploads_dir, "book.pdf"),
+            "filename": "book.pdf",
+            "collection_name": "book_test",
+            "content_hash": "hash1",
+        }
+        
+        with patch('core.jobs.chunk_and_embed', return_value=(MagicMock(), stats)) as mock_embed, \
+             patch('core.jobs.get_pdf_page_count', return_value=2), \
+             patch('core.jobs.iter_text_from_pdf'):
+            book_id = run_ingest_job(self.db, job_id, payload)
+            
+            # A second upload of the same file reuses the first book's content
+            duplicate_id = run_ingest_job(self.db, job_id, dict(payload, filename="copy.pdf"))
+        
+        mock_embed.assert_called_once()
+        book = self.db.get_book_by_id(book_id)
+        self.assertEqual((book[1], book[4], book[5], book[6]), ("book", "book_test", 2, 120))
+        self.assertEqual(self.db.get_book_by_id(duplicate_id)[4], "book_test")
+        self.assertIsNone(self.db.get_latest_summary(book_id))
+        self.assertEqual(self.db.get_summary_status(book_id), "pending")
+        # The duplicate waits for the original's summary instead of queueing its own
+        self.assertEqual(self.db.get_summary_status(duplicate_id), "pending")
+        
+        # Uploads queued meanwhile are claimed before a requested summary, which beats the automatic one
+        other_id = self.db.add_book("Other", "other.pdf", "/tmp/other.pdf", "other_test", 1, 10)
+        requested_job_id = queue_summary(self.db, other_id, priority=REQUESTED_SUMMARY_PRIORITY)
+        upload_id = self.db.add_job(INGEST_JOB, {}, priority=INGEST_PRIORITY)
+        self.assertEqual(self.db.claim_next_job()[0], job_id)
+        self.assertEqual(self.db.claim_next_job()[0], upload_id)
+        
+        with patch('core.jobs.get_vector_store'), \
+             patch('core.jobs.get_ollama_llm'), \
+             patch('core.jobs.get_summary_chain', return_value=lambda: {"result": "A summary."}) as mock_chain:
+            summary_jobs = [self.db.claim_next_job(), self.db.claim_next_job()]
+            self.assertIsNone(self.db.claim_next_job())
+            self.assertEqual(summary_jobs[0][0], requested_job_id)
+            for summary_job in summary_jobs:
+                self.assertEqual(summary_job[1], SUMMARY_JOB)
+                run_summary_job(self.db, summary_job[0], summary_job[2])
+        
+        self.assertEqual(mock_chain.call_count, 2)
+        self.assertEqual(self.db.get_latest_summary(book_id)[0], "A summary.")
+        self.assertEqual(self.db.get_latest_summary(duplicate_id)[0], "A summary.")
+        self.assertEqual(self.db.get_summary_status(book_id), "done")
+        self.assertEqual(self.db.get_summary_status(duplicate_id), "done")
+    
+    def test_ingest_job_survives_unreadable_page_count(self):
+        """Test a file PyPDF2 can't parse still reaches extraction, and one with no text is reported as such"""
+        job_id = self.db.add_job(INGEST_JOB)
+        payload = {
+            "file_path": os.path.join(self.uploads_dir, "broken.pdf"),
+            "filename": "broken.pdf",
+            "collection_name": "broken_test",
+        }
+        empty_store = MagicMock()
+        stats = MagicMock(chunks=0, pages=0, chars=0)
+        
+        with patch('core.jobs.get_pdf_page_count', side_effect=PyPDF2.errors.PdfReadError("EOF marker not found")), \
+             patch('core.jobs.iter_text_from_pdf'), \
+             patch('core.jobs.chunk_and_embed', return_value=(empty_store, stats)) as mock_embed:
+            with self.assertRaisesRegex(ValueError, "No extractable text"):
+                run_ingest_job(self.db, job_id, payload)
+        
+        self.assertIsNone(mock_embed.call_args.kwargs["total_pages"])
+        empty_store.delete_collection.assert_called_once()
+    
+    def test_summary_job_failure_is_recorded(self):
+        """Test a failed summary leaves the book usable and marks the summary failed"""
+        book_id = self.db.add_book("Book", "book.pdf", "/tmp/book.pdf", "book_test", 1, 10)
+        job_id = queue_summary(self.db, book_id)
+        duplicate_id = self.db.add_book("Copy", "copy.pdf", "/tmp/book.pdf", "book_test", 1, 10)
+        self.assertIsNone(queue_duplicate_summary(self.db, duplicate_id, "book_test"))
+        # A book on the same collection with its own queued job is left to that job
+        regenerating_id = self.db.add_book("Second copy", "copy2.pdf", "/tmp/book.pdf", "book_test", 1, 10)
+        queue_summary(self.db, regenerating_id)
+        job = self.db.claim_next_job()
+        self.assertEqual(job[0], job_id)
+        
+        with patch('core.jobs.get_vector_store', return_value=None):
+            with self.assertRaises(ValueError):
+                run_summary_job(self.db, job_id, job[2])
+        
+        self.assertEqual(self.db.get_summary_status(book_id), "failed")
+        self.assertIsNone(self.db.get_latest_summary(book_id))
+        # The waiting duplicate can be retried instead of staying pending forever
+        self.assertEqual(self.db.get_summary_status(duplicate_id), "failed")
+        self.assertEqual(self.db.get_summary_status(regenerating_id), "pending")
+    
+    def test_answer_cache_hits_exact_and_similar_questions(self):
+        """Test cached answers are keyed by model and prompt version and match near-duplicates"""
+        cache = AnswerCache(db_path=self.db_path, similarity_threshold=0.95)
+        vectors = {
+            "what is the book about": [1.0, 0.0, 0.0],
+            "what's this book about": [0.99, 0.05, 0.0],
+            "who is the author": [0.0, 1.0, 0.0],
+        }
+        embed_query = vectors.get
+        
+        cache.store("book_test", "What is the book about?", "llama2", 1, "Dragons.", '[{"page": 1}]',
+                    embed_query=embed_query)
+        
+        self.assertEqual(cache.lookup("book_test", "  what is the BOOK about", "llama2", 1),
+                         ("Dragons.", '[{"page": 1}]'))
+        self.assertEqual(cache.lookup("book_test", "What's this book about?", "llama2", 1,
+                                      embed_query=embed_query)[0], "Dragons.")
+        self.assertIsNone(cache.lookup("book_test", "Who is the author?", "llama2", 1, embed_query=embed_query))
+        self.assertIsNone(cache.lookup("book_test", "What is the book about?", "llama2", 2))
+        self.assertIsNone(cache.lookup("book_test", "What is the book about?", "mistral", 1))
+        self.assertIsNone(cache.lookup("book_other", "What is the book about?", "llama2", 1))
+    
+    def test_answer_cache_defaults_to_exact_matches(self):
+        """Test questions differing only by an entity never share an answer unless semantic matching is enabled"""
+        cache = AnswerCache(db_path=self.db_path)
+        vectors = {
+            "who killed duncan": [1.0, 0.0, 0.0],
+            "who killed banquo": [0.99, 0.1, 0.0],
+        }
+        
+        cache.store("book_test", "Who killed Duncan?", "llama2", 1, "Macbeth.", "[]", embed_query=vectors.get)
+        
+        self.assertEqual(cache.similarity_threshold, 0)
+        self.assertIsNone(cache.lookup("book_test", "Who killed Banquo?", "llama2", 1, embed_query=vectors.get))
+        self.assertEqual(cache.lookup("book_test", "who killed Duncan", "llama2", 1)[0], "Macbeth.")
+    
+    def test_answer_cache_expiry_and_eviction(self):
+        """Test expired entries miss and the least recently hit entries are evicted"""
+        cache = AnswerCache(db_path=self.db_path, max_entries=2, similarity_threshold=0)
+        cache.store("book_test", "q1", "llama2", 1, "a1")
+        cache.store("book_test", "q2", "llama2", 1, "a2")
+        cache.lookup("book_test", "q1", "llama2", 1)
+        cache.store("book_test", "q3", "llama2", 1, "a3")
+        
+        self.assertIsNotNone(cache.lookup("book_test", "q1", "llama2", 1))
+        self.assertIsNone(cache.lookup("book_test", "q2", "llama2", 1))
+        
+        expired = AnswerCache(db_path=self.db_path, ttl_seconds=-1, similarity_threshold=0)
+        self.assertIsNone(expired.lookup("book_test", "q3", "llama2", 1))
+        
+        cache.invalidate_collection("book_test")
+        self.assertIsNone(cache.lookup("book_test", "q1", "llama2", 1))
+    
     def test_full_workflow(self):
         """Test complete workflow from upload to chat"""
         # 1. Add a book to database